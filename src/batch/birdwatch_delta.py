@@ -0,0 +1,164 @@
+import json
+import os
+from datetime import date, timedelta
+from logging import getLogger
+
+import pandas as pd
+
+from util.birdwatch_data import (
+    column_dtype,
+    iter_columns,
+    read_columns,
+    shard_paths,
+    shard_signature,
+)
+from util.run_stats import RunStats
+
+
+class BirdwatchDeltaBatchProps:
+    def __init__(self, input_dir: str, output_dir: str, chunksize: int = 100_000):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.chunksize = chunksize
+
+    def to_dict(self):
+        return {
+            "input_dir": self.input_dir,
+            "output_dir": self.output_dir,
+            "chunksize": self.chunksize,
+        }
+
+    @staticmethod
+    def from_dict(data: dict):
+        return BirdwatchDeltaBatchProps(
+            input_dir=data["input_dir"],
+            output_dir=data["output_dir"],
+            chunksize=data.get("chunksize", 100_000),
+        )
+
+
+class BirdwatchDeltaBatch:
+    def __init__(self, props: BirdwatchDeltaBatchProps):
+        self.props = props
+        self.logger = getLogger(__name__)
+        self.stats = RunStats()
+
+    def run(self):
+        self.stats = RunStats()
+        self.__compute_target_date(date.today())
+        self.__compute_target_date(date.today() - timedelta(days=1))
+        return self.stats.to_dict()
+
+    def __compute_target_date(self, target_date: date):
+        current_dir = os.path.join(self.props.input_dir, str(target_date))
+        previous_dir = os.path.join(
+            self.props.input_dir, str(target_date - timedelta(days=1))
+        )
+        output_path = os.path.join(self.props.output_dir, f"{target_date}.jsonl")
+        inputs_path = os.path.join(self.props.output_dir, f"{target_date}.inputs.json")
+        input_paths = []
+        for date_dir in [current_dir, previous_dir]:
+            for value in ["notes", "noteStatusHistory", "ratings"]:
+                paths = shard_paths(date_dir, value)
+                if len(paths) == 0:
+                    self.logger.info("Snapshot not found: %s %s", date_dir, value)
+                    return
+                input_paths.extend(paths)
+        # The shards a delta was computed from are recorded next to it, since
+        # a shard landing mid-run keeps a download-time mtime older than the
+        # output and would otherwise never be picked up
+        # Recorded as an object; the bare lists written before may come with
+        # float ids from Parquet inputs, so they no longer match
+        inputs = {"shards": shard_signature(input_paths)}
+        if os.path.exists(output_path) and self.__read_inputs(inputs_path) == inputs:
+            return
+        os.makedirs(self.props.output_dir, exist_ok=True)
+        counts = {}
+        try:
+            with open(output_path + ".tmp", "w") as f:
+                counts["note"] = self.__write_new_notes(f, current_dir, previous_dir)
+                counts["status"] = self.__write_status_changes(
+                    f, current_dir, previous_dir
+                )
+                counts["rating"] = self.__write_new_ratings(
+                    f, current_dir, previous_dir
+                )
+        except Exception as ex:
+            self.logger.error(ex)
+            if os.path.exists(output_path + ".tmp"):
+                os.remove(output_path + ".tmp")
+            return
+        os.replace(output_path + ".tmp", output_path)
+        with open(inputs_path + ".tmp", "w") as f:
+            json.dump(inputs, f)
+        os.replace(inputs_path + ".tmp", inputs_path)
+        self.logger.info("Computed delta %s: %s", target_date, counts)
+        self.stats.add("items", sum(counts.values()))
+
+    def __read_inputs(self, inputs_path: str) -> dict | None:
+        if not os.path.exists(inputs_path):
+            return None
+        with open(inputs_path, "r") as f:
+            return json.load(f)
+
+    def __write_new_notes(self, f, current_dir: str, previous_dir: str) -> int:
+        previous_ids = pd.Index(
+            read_columns(previous_dir, "notes", ["noteId"])["noteId"]
+        )
+        count = 0
+        for chunk in iter_columns(current_dir, "notes", None, self.props.chunksize):
+            chunk = chunk[previous_ids.get_indexer(chunk["noteId"]) < 0]
+            count += self.__write_records(f, chunk, "note")
+        return count
+
+    def __write_status_changes(self, f, current_dir: str, previous_dir: str) -> int:
+        previous = read_columns(
+            previous_dir, "noteStatusHistory", ["noteId", "currentStatus"]
+        )
+        previous_status = previous.set_index("noteId")["currentStatus"].astype("string")
+        count = 0
+        for chunk in iter_columns(
+            current_dir,
+            "noteStatusHistory",
+            ["noteId", "currentStatus", "timestampMillisOfCurrentStatus"],
+            self.props.chunksize,
+        ):
+            status = chunk["currentStatus"].astype("string")
+            previous_chunk_status = previous_status.reindex(chunk["noteId"]).array
+            changed = (status.array != previous_chunk_status).fillna(True)
+            chunk = chunk.assign(
+                previousStatus=previous_chunk_status, currentStatus=status
+            )[changed]
+            count += self.__write_records(f, chunk, "status")
+        return count
+
+    def __write_new_ratings(self, f, current_dir: str, previous_dir: str) -> int:
+        # Ratings are append-mostly, so the previous snapshot's newest rating
+        # is a watermark; an anti-join on (noteId, rater) would not fit in memory
+        watermark = None
+        for chunk in iter_columns(
+            previous_dir, "ratings", ["createdAtMillis"], self.props.chunksize
+        ):
+            chunk_max = chunk["createdAtMillis"].max()
+            if pd.notna(chunk_max) and (watermark is None or chunk_max > watermark):
+                watermark = chunk_max
+        count = 0
+        for chunk in iter_columns(current_dir, "ratings", None, self.props.chunksize):
+            if watermark is not None:
+                chunk = chunk[(chunk["createdAtMillis"] > watermark).fillna(False)]
+            count += self.__write_records(f, chunk, "rating")
+        return count
+
+    def __write_records(self, f, data: pd.DataFrame, change_type: str) -> int:
+        if len(data) == 0:
+            return 0
+        # A float id has already lost digits and would no longer join, so
+        # the delta fails instead of writing it
+        for column in data.columns:
+            if column_dtype(column) in ("int64", "Int64", "Int8") and not (
+                pd.api.types.is_integer_dtype(data[column])
+            ):
+                raise ValueError(f"Non-integer column {column}: {data[column].dtype}")
+        data = data.assign(changeType=change_type)
+        f.write(data.to_json(orient="records", lines=True, force_ascii=False))
+        return len(data)
@@ -0,0 +1,115 @@
+import json
+import os
+from datetime import date, timedelta
+from logging import getLogger
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from handler.birdwatch_raw import FILENAME_KEY
+from util.birdwatch_data import (
+    column_dtype,
+    SHARDS_METADATA_KEY,
+    has_parquet,
+    parquet_path,
+    read_header,
+    read_tsv,
+    shard_paths,
+    shard_signature,
+)
+from util.run_stats import RunStats
+
+ARROW_TYPES = {
+    "int64": pa.int64(),
+    "Int64": pa.int64(),
+    "Int8": pa.int8(),
+    "category": pa.dictionary(pa.int32(), pa.string()),
+    "string": pa.string(),
+}
+
+
+class BirdwatchParquetBatchProps:
+    def __init__(
+        self, input_dir: str, chunksize: int = 1_000_000, compression: str = "zstd"
+    ):
+        self.input_dir = input_dir
+        self.chunksize = chunksize
+        self.compression = compression
+
+    def to_dict(self):
+        return {
+            "input_dir": self.input_dir,
+            "chunksize": self.chunksize,
+            "compression": self.compression,
+        }
+
+    @staticmethod
+    def from_dict(data: dict):
+        return BirdwatchParquetBatchProps(
+            input_dir=data["input_dir"],
+            chunksize=data.get("chunksize", 1_000_000),
+            compression=data.get("compression", "zstd"),
+        )
+
+
+class BirdwatchParquetBatch:
+    def __init__(self, props: BirdwatchParquetBatchProps):
+        self.props = props
+        self.logger = getLogger(__name__)
+        self.stats = RunStats()
+
+    def run(self):
+        self.stats = RunStats()
+        self.__convert_target_date(date.today())
+        self.__convert_target_date(date.today() - timedelta(days=1))
+        return self.stats.to_dict()
+
+    def __convert_target_date(self, target_date: date):
+        date_dir = os.path.join(self.props.input_dir, str(target_date))
+        for value in FILENAME_KEY.values():
+            paths = shard_paths(date_dir, value)
+            if len(paths) == 0:
+                continue
+            if has_parquet(date_dir, value):
+                continue
+            output_path = parquet_path(date_dir, value)
+            try:
+                self.__convert(paths, output_path)
+            except Exception as ex:
+                self.logger.error(ex)
+                if os.path.exists(output_path + ".tmp"):
+                    os.remove(output_path + ".tmp")
+
+    def __convert(self, paths: list[str], output_path: str):
+        # Taken before reading, so a shard replaced meanwhile no longer
+        # matches and the next run converts again
+        signature = shard_signature(paths)
+        header = read_header(paths[0])
+        # The pandas metadata is kept alongside the signature so nullable ints
+        # and strings read back with the same dtypes as the TSV path
+        empty = pd.DataFrame(
+            {column: pd.Series(dtype=column_dtype(column)) for column in header}
+        )
+        pandas_metadata = pa.Schema.from_pandas(empty, preserve_index=False).metadata
+        schema = pa.schema(
+            [(column, ARROW_TYPES[column_dtype(column)]) for column in header],
+            metadata={**pandas_metadata, SHARDS_METADATA_KEY: json.dumps(signature)},
+        )
+        rows = 0
+        with pq.ParquetWriter(
+            output_path + ".tmp", schema, compression=self.props.compression
+        ) as writer:
+            for path in paths:
+                with read_tsv(path, header, chunksize=self.props.chunksize) as reader:
+                    for chunk in reader:
+                        table = pa.Table.from_pandas(
+                            chunk.reindex(columns=header),
+                            schema=schema,
+                            preserve_index=False,
+                        )
+                        writer.write_table(table)
+                        rows += len(chunk)
+        os.replace(output_path + ".tmp", output_path)
+        self.logger.info("Converted %d rows: %s", rows, output_path)
+        self.stats.add("items", rows)
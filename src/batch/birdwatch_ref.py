@@ -1,26 +1,47 @@
 import json
 import os
-import time
 from datetime import date, timedelta
-from glob import glob
 from logging import getLogger
-from pathlib import Path
 
-import pandas as pd
 from twitter.scraper import Scraper
 
+from util.birdwatch_data import iter_columns
+from util.fetched_store import get_fetched_store
+from util.language import LanguageFilter, LanguageFilterProps
+from util.metrics import get_metrics
+from util.rate_limiter import RateLimiterProps, get_rate_limiter
+from util.run_stats import RunStats
+
+TWEETS_BY_IDS_RATE_LIMIT = RateLimiterProps("twitter.tweets_by_ids", 500, 900.0)
+
 
 class BirdwatchRefBatchProps:
-    def __init__(self, input_dir: str, output_dir: str, cookie_path: str):
+    def __init__(
+        self,
+        input_dir: str,
+        output_dir: str,
+        cookie_path: str,
+        tweets_by_ids_rate_limit: RateLimiterProps = TWEETS_BY_IDS_RATE_LIMIT,
+        chunksize: int = 100_000,
+        language_filter: LanguageFilterProps | None = None,
+    ):
         self.input_dir = input_dir
         self.output_dir = output_dir
         self.cookie_path = cookie_path
+        self.tweets_by_ids_rate_limit = tweets_by_ids_rate_limit
+        self.chunksize = chunksize
+        self.language_filter = (
+            language_filter if language_filter is not None else LanguageFilterProps()
+        )
 
     def to_dict(self):
         return {
             "input_dir": self.input_dir,
             "output_dir": self.output_dir,
             "cookie_path": self.cookie_path,
+            "tweets_by_ids_rate_limit": self.tweets_by_ids_rate_limit.to_dict(),
+            "chunksize": self.chunksize,
+            "language_filter": self.language_filter.to_dict(),
         }
 
     @staticmethod
@@ -29,72 +50,89 @@ class BirdwatchRefBatchProps:
             input_dir=data["input_dir"],
             output_dir=data["output_dir"],
             cookie_path=data["cookie_path"],
+            tweets_by_ids_rate_limit=(
+                RateLimiterProps.from_dict(data["tweets_by_ids_rate_limit"])
+                if "tweets_by_ids_rate_limit" in data
+                else TWEETS_BY_IDS_RATE_LIMIT
+            ),
+            chunksize=data.get("chunksize", 100_000),
+            language_filter=(
+                LanguageFilterProps.from_dict(data["language_filter"])
+                if "language_filter" in data
+                else None
+            ),
         )
 
 
 BATCH_SIZE = 220
-RATE_LIMIT = 500
 
 
 class BirdwatchRefBatch:
+    scraper_class = Scraper
+
     def __init__(self, props: BirdwatchRefBatchProps):
         self.props = props
         self.logger = getLogger(__name__)
+        self.fetched = get_fetched_store(
+            os.path.join(self.props.output_dir, "fetched.jsonl")
+        )
+        self.tweets_by_ids_limiter = get_rate_limiter(
+            self.props.tweets_by_ids_rate_limit
+        )
+        self.language_filter = LanguageFilter(self.props.language_filter)
+        self.stats = RunStats()
 
     def run(self):
+        self.stats = RunStats()
         self.__fetch_target_date(date.today())
         self.__fetch_target_date(date.today() - timedelta(days=1))
+        return self.stats.to_dict()
 
     def __fetch_target_date(self, target_date: date):
-        notes_path_list = glob(
-            os.path.join(self.props.input_dir, str(target_date), "notes-*.json")
-        )
-        notes_data_list = []
-        for notes_path in notes_path_list:
-            with open(notes_path, "rb") as file:
-                if file.read(2) == b"\x1f\x8b":
-                    notes_data_list.append(
-                        pd.read_csv(notes_path, delimiter="\t", compression="gzip")
-                    )
-                else:
-                    notes_data_list.append(pd.read_csv(notes_path, delimiter="\t"))
-        notes_data = pd.concat(notes_data_list)
-        # ---
-        # Ignore not contains Japanese
-        notes_data = notes_data[
-            notes_data["summary"].str.contains("[\u3041-\u309F]+", na=False)
-        ]
-        # Ignore fetched tweet
-        fetched_output_path = os.path.join(self.props.output_dir, "fetched.jsonl")
-        if not Path(fetched_output_path).exists():
-            Path(fetched_output_path).parent.mkdir(parents=True, exist_ok=True)
-            Path(fetched_output_path).touch()
-        with open(fetched_output_path, "r") as f:
-            fetched_output_data = f.read().splitlines()
-        notes_data = notes_data[~notes_data["tweetId"].isin(fetched_output_data)]
-        # ---
         with open(self.props.cookie_path, "r") as f:
             cookie = json.load(f)
-        scraper = Scraper(
+        scraper = self.scraper_class(
             cookies={
                 "ct0": cookie["ct0"],
                 "auth_token": cookie["auth_token"],
             },
             out=self.props.output_dir,
         )
-        last_fetched_at = None
-        for i in range(0, len(notes_data), BATCH_SIZE):
-            if last_fetched_at is not None:
-                elapsed_time = time.time() - last_fetched_at
-                sleep_time = max(
-                    0,
-                    (timedelta(minutes=15).total_seconds() / RATE_LIMIT) - elapsed_time,
-                )
-                time.sleep(sleep_time)
-            end_index = min(i + BATCH_SIZE, len(notes_data))
-            batch_ids = notes_data["tweetId"].iloc[i:end_index].tolist()
+        batch_ids = []
+        for tweet_id in self.__iter_candidate_ids(target_date):
+            batch_ids.append(tweet_id)
+            if len(batch_ids) >= BATCH_SIZE:
+                self.__fetch_tweets(scraper, batch_ids)
+                batch_ids = []
+        if len(batch_ids) > 0:
+            self.__fetch_tweets(scraper, batch_ids)
+
+    def __iter_candidate_ids(self, target_date: date):
+        candidate_ids = set()
+        for notes_data in iter_columns(
+            os.path.join(self.props.input_dir, str(target_date)),
+            "notes",
+            ["tweetId", "summary"],
+            self.props.chunksize,
+        ):
+            # Ignore not contains Japanese
+            notes_data = notes_data[self.language_filter.mask(notes_data["summary"])]
+            # Ignore fetched tweet
+            for tweet_id in notes_data["tweetId"].tolist():
+                if tweet_id in candidate_ids or self.fetched.contains(tweet_id):
+                    continue
+                candidate_ids.add(tweet_id)
+                yield tweet_id
+
+    def __fetch_tweets(self, scraper: Scraper, batch_ids: list[int]):
+        self.tweets_by_ids_limiter.acquire()
+        # The scraper brings its own client, so its calls are timed here
+        with get_metrics().histogram(
+            "http_request_seconds",
+            "Time to response headers per attempt",
+            endpoint=self.props.tweets_by_ids_rate_limit.name,
+        ).time():
             scraper.tweets_by_ids(batch_ids)
-            last_fetched_at = time.time()
-            with open(fetched_output_path, "a") as f:
-                for fetch_id in batch_ids:
-                    f.write(f"{fetch_id}\n")
+        self.fetched.add_many(batch_ids)
+        self.stats.add("requests")
+        self.stats.add("items", len(batch_ids))
@@ -0,0 +1,348 @@
+import argparse
+import json
+import logging
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from logging import getLogger
+from multiprocessing import get_context
+
+from bench.stub_server import (
+    BirdwatchFixtures,
+    StubProps,
+    StubServer,
+    TwitterFixtures,
+    YahooFixtures,
+    YouTubeFixtures,
+)
+from util.rate_limiter import RateLimiterProps
+from util.serializer import dumps_line
+
+logger = getLogger(__name__)
+
+SCENARIOS = ["youtube", "twitter", "birdwatch_raw", "birdwatch_ref"]
+# Each stand-in takes the place of one origin the handlers talk to
+ORIGINS = {
+    "youtube": "https://www.googleapis.com",
+    "twitter": "https://twitter.com",
+    "birdwatch": "https://ton.twimg.com",
+    "yahoo": "https://news.yahoo.co.jp",
+}
+SCENARIO_STUBS = {
+    "youtube": ["youtube"],
+    "twitter": ["twitter", "yahoo"],
+    "birdwatch_raw": ["birdwatch"],
+    "birdwatch_ref": ["twitter"],
+}
+
+
+def bench_rate_limit(name: str, production: RateLimiterProps | None):
+    # Client-side limits are lifted unless asked for, so a run measures the
+    # handler and the stand-in's own throttling rather than idle waits
+    if production is not None:
+        return production
+    return RateLimiterProps(f"bench.{name}", 1000, 1.0, burst=100)
+
+
+class RedirectingClient:
+    def __init__(self, client, origin: str, target: str):
+        self.client = client
+        self.origin = origin
+        self.target = target
+
+    async def get(self, url: str, **kwargs):
+        if url.startswith(self.origin):
+            url = self.target + url[len(self.origin) :]
+        return await self.client.get(url, **kwargs)
+
+
+def stub_scraper_class(target: str):
+    from twitter.scraper import Scraper
+
+    # The scraper builds its own httpx client around a fixed host, so its
+    # queries are pointed at the stand-in one level up
+    class StubScraper(Scraper):
+        async def _query(self, client, operation, **kwargs):
+            return await super()._query(
+                RedirectingClient(client, ORIGINS["twitter"], target),
+                operation,
+                **kwargs,
+            )
+
+    return StubScraper
+
+
+# Handlers are imported inside their runners, so a scenario's peak RSS only
+# counts the modules that scenario loads
+def run_youtube(output_dir: str, options: dict) -> dict:
+    from handler.youtube import (
+        COMMENT_THREADS_RATE_LIMIT,
+        PLAYLIST_ITEMS_RATE_LIMIT,
+        SEARCH_RATE_LIMIT,
+        VIDEOS_RATE_LIMIT,
+        YouTubeHandler,
+        YouTubeHandlerProps,
+    )
+    from util.quota import QuotaProps
+
+    production = options["production_limits"]
+    props = YouTubeHandlerProps(
+        output_dir=os.path.join(output_dir, "YouTube"),
+        handle_name="Bench",
+        api_key="bench-key",
+        channel_ids=[f"UCbench{i:03d}" for i in range(options["channels"])],
+        delta_days=0,
+        period_days=1,
+        request_count=3,
+        comment_request_count=50,
+        max_workers=4,
+        search_rate_limit=bench_rate_limit(
+            "youtube.search", SEARCH_RATE_LIMIT if production else None
+        ),
+        videos_rate_limit=bench_rate_limit(
+            "youtube.videos", VIDEOS_RATE_LIMIT if production else None
+        ),
+        comment_threads_rate_limit=bench_rate_limit(
+            "youtube.commentThreads",
+            COMMENT_THREADS_RATE_LIMIT if production else None,
+        ),
+        quota=QuotaProps(daily_units=10_000, runs_per_day=24),
+        discovery="uploads",
+        playlist_items_rate_limit=bench_rate_limit(
+            "youtube.playlistItems", PLAYLIST_ITEMS_RATE_LIMIT if production else None
+        ),
+    )
+    return YouTubeHandler(props).fetch()
+
+
+def write_cookie(output_dir: str) -> str:
+    cookie_path = os.path.join(output_dir, "cookie.json")
+    with open(cookie_path, "w") as f:
+        json.dump({"ct0": "bench-ct0", "auth_token": "bench-auth-token"}, f)
+    return cookie_path
+
+
+def run_twitter(output_dir: str, options: dict) -> dict:
+    from handler.twitter_quote import (
+        SEARCH_TIMELINE_RATE_LIMIT,
+        TwitterQuoteHandler,
+        TwitterQuoteHandlerProps,
+    )
+
+    props = TwitterQuoteHandlerProps(
+        output_dir=os.path.join(output_dir, "Twitter"),
+        handle_name="Bench",
+        cookie_path=write_cookie(output_dir),
+        screen_names=[f"bench_user{i}" for i in range(options["users"])],
+        delta_days=3,
+        period_hours=3,
+        min_retweet=30,
+        min_favorite=30,
+        quote_min_retweet=0,
+        quote_min_favorite=0,
+        request_count=3,
+        quote_request_count=10,
+        max_workers=3,
+        quote_max_workers=4,
+        search_timeline_rate_limit=bench_rate_limit(
+            "twitter.SearchTimeline",
+            SEARCH_TIMELINE_RATE_LIMIT if options["production_limits"] else None,
+        ),
+    )
+    return TwitterQuoteHandler(props).fetch()
+
+
+def run_birdwatch_raw(output_dir: str, options: dict) -> dict:
+    from handler.birdwatch_raw import BirdwatchRawHandler, BirdwatchRawHandlerProps
+
+    props = BirdwatchRawHandlerProps(output_dir=os.path.join(output_dir, "Birdwatch"))
+    return BirdwatchRawHandler(props).fetch()
+
+
+def run_birdwatch_ref(output_dir: str, options: dict) -> dict:
+    from batch.birdwatch_ref import (
+        TWEETS_BY_IDS_RATE_LIMIT,
+        BirdwatchRefBatch,
+        BirdwatchRefBatchProps,
+    )
+
+    props = BirdwatchRefBatchProps(
+        input_dir=os.path.join(output_dir, "Birdwatch"),
+        output_dir=os.path.join(output_dir, "BirdwatchRef"),
+        cookie_path=write_cookie(output_dir),
+        tweets_by_ids_rate_limit=bench_rate_limit(
+            "twitter.tweets_by_ids",
+            TWEETS_BY_IDS_RATE_LIMIT if options["production_limits"] else None,
+        ),
+    )
+    batch = BirdwatchRefBatch(props)
+    batch.scraper_class = stub_scraper_class(options["base_urls"]["twitter"])
+    return batch.run()
+
+
+RUNNERS = {
+    "youtube": run_youtube,
+    "twitter": run_twitter,
+    "birdwatch_raw": run_birdwatch_raw,
+    "birdwatch_ref": run_birdwatch_ref,
+}
+
+
+def run_scenario(name: str, output_dir: str, options: dict) -> dict:
+    # Runs in a fresh process, so peak RSS and CPU time belong to this
+    # scenario alone and not to the stand-ins serving it
+    from util.http_client import HttpClientProps, configure_http_client
+
+    logging.basicConfig(level=options["log_level"])
+    configure_http_client(
+        HttpClientProps(
+            pool_connections=8,
+            pool_maxsize=4,
+            timeout=30.0,
+            backoff_base=options["backoff_base"],
+            backoff_max=options["backoff_max"],
+            host_overrides={
+                ORIGINS[stub]: base_url
+                for stub, base_url in options["base_urls"].items()
+            },
+        )
+    )
+    started_at = time.perf_counter()
+    stats = RUNNERS[name](output_dir, options) or {}
+    wall_time = time.perf_counter() - started_at
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "wall_time": wall_time,
+        "cpu_time": usage.ru_utime + usage.ru_stime,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": usage.ru_maxrss / 1024,
+        "stats": stats,
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s:%(lineno)s %(funcName)s [%(levelname)s]: %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Run the handlers end to end against local stand-in servers"
+    )
+    parser.add_argument("scenarios", nargs="*", help=f"any of {SCENARIOS}")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--rate-limit", type=int, default=None, help="requests per second per stub"
+    )
+    parser.add_argument("--production-limits", action="store_true")
+    parser.add_argument("--channels", type=int, default=7)
+    parser.add_argument("--videos-per-channel", type=int, default=50)
+    parser.add_argument("--comments-per-video", type=int, default=300)
+    parser.add_argument("--users", type=int, default=3)
+    parser.add_argument("--tweets-per-user", type=int, default=60)
+    parser.add_argument("--quotes-per-tweet", type=int, default=40)
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--rows-per-shard", type=int, default=20_000)
+    parser.add_argument("--backoff-base", type=float, default=0.05)
+    parser.add_argument("--backoff-max", type=float, default=1.0)
+    parser.add_argument("--output-dir", help="kept after the run when given")
+    parser.add_argument("--results", help="append results as JSON lines")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"Unknown scenario: {name}")
+    scenarios = [name for name in SCENARIOS if name in (args.scenarios or SCENARIOS)]
+    if "birdwatch_ref" in scenarios and "birdwatch_raw" not in scenarios:
+        # The batch reads the notes the raw handler downloads
+        scenarios.insert(scenarios.index("birdwatch_ref"), "birdwatch_raw")
+
+    stub_props = StubProps(
+        latency=args.latency, rate_limit=args.rate_limit, error_rate=args.error_rate
+    )
+    stubs = {
+        "youtube": StubServer(
+            "youtube",
+            YouTubeFixtures(args.videos_per_channel, args.comments_per_video),
+            stub_props,
+        ),
+        "twitter": StubServer(
+            "twitter",
+            TwitterFixtures(args.tweets_per_user, args.quotes_per_tweet),
+            stub_props,
+        ),
+        "yahoo": StubServer("yahoo", YahooFixtures(), stub_props),
+        "birdwatch": StubServer(
+            "birdwatch", BirdwatchFixtures(args.shards, args.rows_per_shard), stub_props
+        ),
+    }
+    options = {
+        "base_urls": {name: stub.start() for name, stub in stubs.items()},
+        "production_limits": args.production_limits,
+        "channels": args.channels,
+        "users": args.users,
+        "backoff_base": args.backoff_base,
+        "backoff_max": args.backoff_max,
+        "log_level": args.log_level,
+    }
+
+    temp_dir = None
+    output_dir = args.output_dir
+    if output_dir is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        output_dir = temp_dir.name
+    os.makedirs(output_dir, exist_ok=True)
+    try:
+        for name in scenarios:
+            before = {stub: stubs[stub].counts() for stub in SCENARIO_STUBS[name]}
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=get_context("spawn")
+            ) as executor:
+                result = executor.submit(
+                    run_scenario, name, output_dir, options
+                ).result()
+            served = {
+                key: sum(
+                    stubs[stub].counts()[key] - before[stub][key] for stub in before
+                )
+                for key in ["requests", "throttled", "errors"]
+            }
+            items = result["stats"].get("items", 0)
+            result = {
+                "scenario": name,
+                **result,
+                "served": served,
+                "items_per_second": items / result["wall_time"],
+                "requests_per_item": served["requests"] / items if items else None,
+                "stub": stub_props.to_dict(),
+            }
+            logger.info(
+                "%s: %d items in %.2fs (%.1f items/s), %d requests"
+                " (%s per item, %d throttled, %d errors), cpu %.2fs, peak rss %.1f MB",
+                name,
+                items,
+                result["wall_time"],
+                result["items_per_second"],
+                served["requests"],
+                (
+                    f"{result['requests_per_item']:.2f}"
+                    if result["requests_per_item"] is not None
+                    else "-"
+                ),
+                served["throttled"],
+                served["errors"],
+                result["cpu_time"],
+                result["peak_rss_mb"],
+            )
+            if args.results is not None:
+                with open(args.results, "ab") as f:
+                    f.write(dumps_line(result))
+    finally:
+        for stub in stubs.values():
+            stub.stop()
+        if temp_dir is not None:
+            temp_dir.cleanup()
@@ -0,0 +1,69 @@
+import argparse
+import logging
+import time
+from glob import glob
+from logging import getLogger
+
+from util.serializer import SERIALIZERS, orjson
+from util.sink import iter_lines
+
+logger = getLogger(__name__)
+
+
+def load_samples(patterns: list[str], limit: int) -> list[bytes]:
+    samples = []
+    for pattern in patterns:
+        for path in sorted(glob(pattern)):
+            for line in iter_lines(path):
+                samples.append(line)
+                if len(samples) >= limit:
+                    return samples
+    return samples
+
+
+def measure(func, samples: list, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        for sample in samples:
+            func(sample)
+        elapsed = time.perf_counter() - started_at
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s:%(lineno)s %(funcName)s [%(levelname)s]: %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Compare JSON serializers on saved raw archives"
+    )
+    parser.add_argument("patterns", nargs="+", help="e.g. 'Twitter/*/*_raw*.jsonl*'")
+    parser.add_argument("--limit", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = load_samples(args.patterns, args.limit)
+    if len(samples) == 0:
+        parser.error("No samples found")
+    size = sum(len(sample) for sample in samples) / 1_000_000
+    logger.info("Loaded %d samples (%.1f MB)", len(samples), size)
+
+    objects = SERIALIZERS["json"]().loads(b"[" + b",".join(samples) + b"]")
+    for name, serializer_class in SERIALIZERS.items():
+        if name == "orjson" and orjson is None:
+            logger.info("Skipped %s: not installed", name)
+            continue
+        serializer = serializer_class()
+        for operation, func, inputs in [
+            ("loads", serializer.loads, samples),
+            ("dumps_line", serializer.dumps_line, objects),
+            ("dumps_canonical", serializer.dumps_canonical, objects),
+        ]:
+            elapsed = measure(func, inputs, args.repeat)
+            logger.info(
+                "%s %s: %.3fs, %.1f MB/s", name, operation, elapsed, size / elapsed
+            )
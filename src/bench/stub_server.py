@@ -0,0 +1,494 @@
+import json
+import random
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from urllib.parse import parse_qsl, urlsplit
+
+from handler.birdwatch_raw import FILENAME_KEY
+from handler.twitter_quote import PRELOADED_STATE_MARKER
+
+
+class StubProps:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        rate_limit: int | None = None,
+        rate_limit_period: float = 1.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_limit_period = rate_limit_period
+        self.error_rate = error_rate
+        self.seed = seed
+
+    def to_dict(self):
+        return {
+            "latency": self.latency,
+            "rate_limit": self.rate_limit,
+            "rate_limit_period": self.rate_limit_period,
+            "error_rate": self.error_rate,
+            "seed": self.seed,
+        }
+
+    @staticmethod
+    def from_dict(props: dict):
+        return StubProps(
+            latency=props.get("latency", 0.0),
+            rate_limit=props.get("rate_limit"),
+            rate_limit_period=props.get("rate_limit_period", 1.0),
+            error_rate=props.get("error_rate", 0.0),
+            seed=props.get("seed", 0),
+        )
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that stop reading early, like the streaming pickup reader,
+        # reset the connection; that is expected and not worth a traceback
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+def json_response(data, status: int = 200):
+    return status, {"Content-Type": "application/json"}, json.dumps(data).encode()
+
+
+class StubServer:
+    def __init__(self, name: str, app, props: StubProps):
+        self.name = name
+        self.app = app
+        self.props = props
+        self.logger = getLogger(__name__)
+        self.server: StubHTTPServer | None = None
+        self.__lock = threading.Lock()
+        self.__random = random.Random(props.seed)
+        self.__window_started_at = time.monotonic()
+        self.__window_count = 0
+        self.__counts = {"requests": 0, "throttled": 0, "errors": 0}
+
+    def start(self) -> str:
+        stub = self
+
+        class StubRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parsed = urlsplit(self.path)
+                status, headers, body = stub.handle(
+                    parsed.path, dict(parse_qsl(parsed.query)), self.headers
+                )
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = StubHTTPServer(("127.0.0.1", 0), StubRequestHandler)
+        threading.Thread(
+            target=self.server.serve_forever, name=f"stub-{self.name}", daemon=True
+        ).start()
+        base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.logger.info("Serving %s: %s", self.name, base_url)
+        return base_url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def counts(self) -> dict[str, int]:
+        with self.__lock:
+            return dict(self.__counts)
+
+    def handle(self, path: str, query: dict[str, str], headers):
+        if self.props.latency > 0:
+            time.sleep(self.props.latency)
+        limit_headers = {}
+        with self.__lock:
+            self.__counts["requests"] += 1
+            if self.props.rate_limit is not None:
+                # A fixed window with Twitter's x-rate-limit-* headers, which
+                # is what the client's limiter reads back
+                now = time.monotonic()
+                if now - self.__window_started_at >= self.props.rate_limit_period:
+                    self.__window_started_at = now
+                    self.__window_count = 0
+                self.__window_count += 1
+                reset = time.time() + (
+                    self.__window_started_at + self.props.rate_limit_period - now
+                )
+                remaining = max(0, self.props.rate_limit - self.__window_count)
+                limit_headers = {
+                    "x-rate-limit-limit": str(self.props.rate_limit),
+                    "x-rate-limit-remaining": str(remaining),
+                    "x-rate-limit-reset": str(int(reset) + 1),
+                }
+                if self.__window_count > self.props.rate_limit:
+                    self.__counts["throttled"] += 1
+                    return 429, limit_headers, b'{"errors":[{"code":88}]}'
+            if self.__random.random() < self.props.error_rate:
+                self.__counts["errors"] += 1
+                return 503, limit_headers, b"Service Unavailable"
+        status, response_headers, body = self.app(path, query, headers)
+        return status, {**limit_headers, **response_headers}, body
+
+
+def isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%SZ"
+    )
+
+
+class YouTubeFixtures:
+    def __init__(
+        self,
+        videos_per_channel: int = 100,
+        comments_per_video: int = 300,
+        page_size: int = 50,
+    ):
+        self.videos_per_channel = videos_per_channel
+        self.comments_per_video = comments_per_video
+        self.page_size = page_size
+        # Uploads are a minute apart, newest first, ending just before start
+        self.started_at = time.time()
+
+    def __video_ids(self, channel_id: str) -> list[str]:
+        return [f"{channel_id}-v{i:05d}" for i in range(self.videos_per_channel)]
+
+    def __published_at(self, video_id: str) -> str:
+        index = int(video_id.rsplit("-v", 1)[1])
+        return isoformat(self.started_at - 60 * (index + 1))
+
+    def __page(self, values: list, query: dict[str, str], page_size: int):
+        offset = int(query.get("pageToken") or 0)
+        page = {"items": values[offset : offset + page_size]}
+        if offset + page_size < len(values):
+            page["nextPageToken"] = str(offset + page_size)
+        return page
+
+    def __call__(self, path: str, query: dict[str, str], headers):
+        endpoint = path.rsplit("/", 1)[-1]
+        if endpoint == "search":
+            items = [
+                {"id": {"kind": "youtube#video", "videoId": video_id}}
+                for video_id in self.__video_ids(query["channelId"])
+            ]
+            return json_response(self.__page(items, query, self.page_size))
+        if endpoint == "channels":
+            return json_response(
+                {
+                    "items": [
+                        {
+                            "id": query["id"],
+                            "contentDetails": {
+                                "relatedPlaylists": {"uploads": "UU" + query["id"]}
+                            },
+                        }
+                    ]
+                }
+            )
+        if endpoint == "playlistItems":
+            items = []
+            for video_id in self.__video_ids(query["playlistId"][2:]):
+                published_at = self.__published_at(video_id)
+                items.append(
+                    {
+                        "snippet": {"publishedAt": published_at},
+                        "contentDetails": {
+                            "videoId": video_id,
+                            "videoPublishedAt": published_at,
+                        },
+                    }
+                )
+            return json_response(self.__page(items, query, self.page_size))
+        if endpoint == "videos":
+            return json_response(
+                {
+                    "items": [
+                        self.__video(video_id) for video_id in query["id"].split(",")
+                    ]
+                }
+            )
+        if endpoint == "commentThreads":
+            video_id = query["videoId"]
+            items = [
+                self.__comment(video_id, i) for i in range(self.comments_per_video)
+            ]
+            return json_response(self.__page(items, query, int(query["maxResults"])))
+        return json_response({"error": {"code": 404}}, 404)
+
+    def __video(self, video_id: str) -> dict:
+        return {
+            "id": video_id,
+            "snippet": {
+                "publishedAt": self.__published_at(video_id),
+                "title": f"ニュース {video_id}",
+                "description": "テスト用の動画説明です。" * 20,
+                "channelTitle": video_id.rsplit("-v", 1)[0],
+                "categoryId": "25",
+                "tags": ["ニュース", "テスト"],
+            },
+            "statistics": {
+                "viewCount": "12345",
+                "likeCount": "123",
+                "favoriteCount": "0",
+                "commentCount": str(self.comments_per_video),
+            },
+        }
+
+    def __comment(self, video_id: str, index: int) -> dict:
+        published_at = isoformat(self.started_at - index)
+        return {
+            "id": f"{video_id}-c{index:05d}",
+            "snippet": {
+                "videoId": video_id,
+                "topLevelComment": {
+                    "snippet": {
+                        "textDisplay": f"コメント {index} " + "本文" * 30,
+                        "authorDisplayName": f"user{index % 97}",
+                        "authorChannelId": {"value": f"UCuser{index % 97:05d}"},
+                        "likeCount": index % 13,
+                        "publishedAt": published_at,
+                        "updatedAt": published_at,
+                    }
+                },
+                "totalReplyCount": 0,
+            },
+        }
+
+
+class TwitterFixtures:
+    def __init__(
+        self,
+        tweets_per_user: int = 60,
+        quotes_per_tweet: int = 40,
+        pickup_every: int = 2,
+        pickup_pages: int = 10,
+    ):
+        self.tweets_per_user = tweets_per_user
+        self.quotes_per_tweet = quotes_per_tweet
+        self.pickup_every = pickup_every
+        self.pickup_pages = pickup_pages
+
+    def __call__(self, path: str, query: dict[str, str], headers):
+        variables = json.loads(query.get("variables", "{}"))
+        if path.endswith("/SearchTimeline"):
+            return json_response(self.__search_timeline(variables))
+        if path.endswith("/TweetResultsByRestIds"):
+            return json_response(
+                {
+                    "data": {
+                        "tweetResult": [
+                            {"result": self.__tweet(int(tweet_id), None)}
+                            for tweet_id in variables["tweetIds"]
+                        ]
+                    }
+                }
+            )
+        return json_response({"errors": [{"code": 34}]}, 404)
+
+    def __search_timeline(self, variables: dict) -> dict:
+        terms = variables["rawQuery"].split()
+        if terms[0].startswith("quoted_tweet_id:"):
+            parent_id = int(terms[0].split(":", 1)[1])
+            tweets = [
+                self.__tweet(parent_id * 1000 + i, parent_id)
+                for i in range(self.quotes_per_tweet)
+            ]
+        else:
+            user_index = zlib.crc32(terms[0].split(":", 1)[1].encode()) % 1000
+            tweets = [
+                self.__tweet((10**15 + user_index * 10**6 + i), None)
+                for i in range(self.tweets_per_user)
+            ]
+        offset = int(variables.get("cursor") or 0)
+        count = variables["count"]
+        entries = [
+            {
+                "entryId": f"tweet-{tweet['rest_id']}",
+                "content": {"itemContent": {"tweet_results": {"result": tweet}}},
+            }
+            for tweet in tweets[offset : offset + count]
+        ]
+        if offset + count < len(tweets):
+            entries.append(
+                {
+                    "entryId": "cursor-bottom-0",
+                    "content": {"value": str(offset + count)},
+                }
+            )
+        return {
+            "data": {
+                "search_by_raw_query": {
+                    "search_timeline": {
+                        "timeline": {
+                            "instructions": [
+                                {"type": "TimelineAddEntries", "entries": entries}
+                            ]
+                        }
+                    }
+                }
+            }
+        }
+
+    def __tweet(self, tweet_id: int, quoted_id: int | None) -> dict:
+        user_id = tweet_id % 997
+        legacy = {
+            "id_str": str(tweet_id),
+            "user_id_str": str(user_id),
+            "full_text": f"ツイート {tweet_id} " + "本文" * 40,
+            "created_at": "Sat Oct 17 12:00:00 +0000 2026",
+            "quote_count": self.quotes_per_tweet,
+            "reply_count": 3,
+            "retweet_count": 100,
+            "favorite_count": 200,
+            "bookmark_count": 5,
+            "entities": {"urls": []},
+        }
+        if quoted_id is not None:
+            legacy["quoted_status_id_str"] = str(quoted_id)
+        elif tweet_id % self.pickup_every == 0:
+            pickup_id = tweet_id % self.pickup_pages
+            legacy["entities"]["urls"].append(
+                {"expanded_url": f"https://news.yahoo.co.jp/pickup/{pickup_id}"}
+            )
+        return {
+            "__typename": "Tweet",
+            "rest_id": str(tweet_id),
+            "legacy": legacy,
+            "views": {"count": "10000"},
+            "core": {
+                "user_results": {
+                    "result": {
+                        "legacy": {
+                            "name": f"ユーザー{user_id}",
+                            "screen_name": f"user{user_id}",
+                            "description": "説明" * 20,
+                            "followers_count": 1000,
+                            "friends_count": 100,
+                            "listed_count": 10,
+                            "created_at": "Mon Jan 01 00:00:00 +0000 2018",
+                        }
+                    }
+                }
+            },
+        }
+
+
+class YahooFixtures:
+    def __init__(self, head_bytes: int = 32 * 1024, tail_bytes: int = 256 * 1024):
+        # Real pickup pages put the state script after a large head and
+        # before an even larger tail, which a streaming reader never fetches
+        self.head = b"<html><head>" + b"<meta>" * (head_bytes // 6) + b"</head><body>"
+        self.tail = b"<div></div>" * (tail_bytes // 11) + b"</body></html>"
+
+    def __call__(self, path: str, query: dict[str, str], headers):
+        pickup_id = path.rsplit("/", 1)[-1]
+        state = {
+            "pageData": {
+                "path": path,
+                "pageParam": {
+                    "topittl": f"見出し{pickup_id}",
+                    "topitime": "1700000000",
+                },
+                "description": "記事の概要です。" * 10,
+                "pubDate": "2026-10-17T12:00:00+09:00",
+                "updateDate": "2026-10-17T13:00:00+09:00",
+            },
+            "topicsDetail": {
+                "article": {"title": f"記事{pickup_id}", "mediaName": "テスト新聞"}
+            },
+            "commentShort": {"totalCommentCount": 42},
+        }
+        script = (
+            f"<script>{PRELOADED_STATE_MARKER} "
+            + json.dumps(state, ensure_ascii=False)
+            + "</script>"
+        ).encode()
+        return (
+            200,
+            {"Content-Type": "text/html; charset=utf-8"},
+            self.head + script + self.tail,
+        )
+
+
+BIRDWATCH_COLUMNS = {
+    "notes": ["noteId", "noteAuthorParticipantId", "createdAtMillis", "tweetId"]
+    + ["classification", "summary"],
+    "ratings": ["noteId", "raterParticipantId", "createdAtMillis"]
+    + ["helpfulnessLevel"],
+    "noteStatusHistory": ["noteId", "noteAuthorParticipantId", "createdAtMillis"]
+    + ["currentStatus"],
+    "userEnrollment": ["participantId", "enrollmentState"]
+    + ["successfulRatingNeededToEarnIn", "timestampOfLastStateChange"],
+}
+
+
+class BirdwatchFixtures:
+    def __init__(
+        self, shards: int = 3, rows_per_shard: int = 20_000, japanese_every: int = 3
+    ):
+        self.shards = shards
+        self.rows_per_shard = rows_per_shard
+        self.japanese_every = japanese_every
+        self.__lock = threading.Lock()
+        self.__bodies: dict[tuple[str, int], bytes] = {}
+
+    def __call__(self, path: str, query: dict[str, str], headers):
+        # .../{yyyy}/{mm}/{dd}/{key}/{value}-{index}.tsv
+        parts = path.rsplit("/", 5)
+        key = parts[-2]
+        value, index = parts[-1].removesuffix(".tsv").rsplit("-", 1)
+        if FILENAME_KEY.get(key) != value or int(index) >= self.shards:
+            return 404, {}, b""
+        etag = f'"{"-".join(parts[-5:-2])}-{value}-{index}"'
+        if headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        return 200, {"ETag": etag}, self.__body(value, int(index))
+
+    def __body(self, value: str, index: int) -> bytes:
+        with self.__lock:
+            if (value, index) not in self.__bodies:
+                self.__bodies[(value, index)] = self.__render(value, index)
+            return self.__bodies[(value, index)]
+
+    def __render(self, value: str, index: int) -> bytes:
+        lines = ["\t".join(BIRDWATCH_COLUMNS[value])]
+        for row in range(
+            index * self.rows_per_shard, (index + 1) * self.rows_per_shard
+        ):
+            note_id = 10**18 + row
+            if value == "notes":
+                summary = (
+                    f"この投稿には誤解を招く情報が含まれています {row}"
+                    if row % self.japanese_every == 0
+                    else f"This post is missing important context {row}"
+                )
+                fields = [note_id, f"author{row % 503}", 1700000000000 + row]
+                fields += [2 * 10**18 + row, "MISINFORMED_OR_POTENTIALLY_MISLEADING"]
+                fields += [summary]
+            elif value == "ratings":
+                fields = [note_id, f"rater{row % 1009}", 1700000000000 + row]
+                fields += ["HELPFUL"]
+            elif value == "noteStatusHistory":
+                fields = [note_id, f"author{row % 503}", 1700000000000 + row]
+                fields += ["NEEDS_MORE_RATINGS"]
+            else:
+                fields = [f"participant{row}", "newUser", 5, 1700000000000 + row]
+            lines.append("\t".join(str(field) for field in fields))
+        return ("\n".join(lines) + "\n").encode()
@@ -1,10 +1,14 @@
 import os
-import urllib.error
-import urllib.request
-from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
 from logging import getLogger
 from pathlib import Path
 
+import requests
+
+from util.http_client import get_http_client
+from util.run_stats import RunStats
+
 FILENAME_KEY = {
     "notes": "notes",
     "noteRatings": "ratings",
@@ -15,18 +19,21 @@ BASE_URL = "https://ton.twimg.com/birdwatch-public-data/"
 
 
 class BirdwatchRawHandlerProps:
-    def __init__(self, output_dir: str):
+    def __init__(self, output_dir: str, max_workers: int = 4):
         self.output_dir = output_dir
+        self.max_workers = max_workers
 
     def to_dict(self):
         return {
             "output_dir": self.output_dir,
+            "max_workers": self.max_workers,
         }
 
     @staticmethod
     def from_dict(data: dict):
         return BirdwatchRawHandlerProps(
             output_dir=data["output_dir"],
+            max_workers=data.get("max_workers", 4),
         )
 
 
@@ -34,31 +41,51 @@ class BirdwatchRawHandler:
     def __init__(self, props: BirdwatchRawHandlerProps):
         self.props = props
         self.logger = getLogger(__name__)
+        self.http = get_http_client()
+        self.stats = RunStats()
 
     def fetch(self):
-        self.__fetch_target_date(date.today())
-        self.__fetch_target_date(date.today() - timedelta(days=1))
+        self.stats = RunStats()
+        with ThreadPoolExecutor(max_workers=self.props.max_workers) as executor:
+            self.__fetch_target_date(executor, date.today())
+            self.__fetch_target_date(executor, date.today() - timedelta(days=1))
+        return self.stats.to_dict()
 
-    def __fetch_target_date(self, target_date: date):
+    def __fetch_target_date(self, executor: ThreadPoolExecutor, target_date: date):
         output_path = os.path.join(self.props.output_dir, str(target_date))
         if not Path(output_path).exists():
             Path(output_path).mkdir(parents=True, exist_ok=True)
         for key, value in FILENAME_KEY.items():
+            # The shard count is unknown, so probe in waves until one is missing
             index = 0
             while True:
-                url = f"{BASE_URL}{target_date.strftime('%Y/%m/%d')}/{key}/{value}-{str(index).zfill(5)}.tsv"
-                self.logger.info("Downloading: %s", url)
-                if not os.path.exists(
-                    os.path.join(output_path, f"{value}-{str(index).zfill(5)}.tsv")
-                ):
-                    try:
-                        urllib.request.urlretrieve(
-                            url,
-                            os.path.join(
-                                output_path, f"{value}-{str(index).zfill(5)}.tsv"
-                            ),
-                        )
-                    except urllib.error.HTTPError as ex:
-                        self.logger.error(ex)
-                        break
-                index += 1
+                futures = [
+                    executor.submit(
+                        self.__fetch_shard, output_path, target_date, key, value, i
+                    )
+                    for i in range(index, index + self.props.max_workers)
+                ]
+                if not all([future.result() for future in futures]):
+                    break
+                index += self.props.max_workers
+
+    def __fetch_shard(
+        self, output_path: str, target_date: date, key: str, value: str, index: int
+    ) -> bool:
+        filename = f"{value}-{str(index).zfill(5)}.tsv"
+        url = f"{BASE_URL}{target_date.strftime('%Y/%m/%d')}/{key}/{filename}"
+        self.stats.add("requests")
+        try:
+            if self.http.download(url, os.path.join(output_path, filename)):
+                self.logger.info("Downloaded: %s", url)
+                self.stats.add("items")
+            else:
+                self.logger.info("Not modified: %s", url)
+            return True
+        except requests.HTTPError as ex:
+            if ex.response.status_code not in (403, 404):
+                self.logger.error(ex)
+            return False
+        except requests.RequestException as ex:
+            self.logger.error(ex)
+            return False
@@ -1,22 +1,163 @@
+import codecs
 import datetime
 import json
 import logging
 import os
-import re
-import time
-from datetime import date, timedelta
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
 from logging import getLogger
-from pathlib import Path
+from urllib import parse
 
-import requests
 from requests.cookies import RequestsCookieJar
 
+from util.cache import CacheProps, get_cache
+from util.checkpoint_store import get_checkpoint_store
+from util.extractor import Extractor, Field, compile_path
+from util.fetched_store import get_fetched_store
+from util.http_client import get_http_client
+from util.raw_store import RawStore
+from util.rate_limiter import RateLimiterProps, get_rate_limiter
+from util.run_stats import RunStats
+from util.serializer import loads
+from util.sink import JsonlSinkProps, get_sink
+
 logger = getLogger(__name__)
 
 USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36"
 CLIENT_UUID = "a0f767a2-2b96-4667-b672-b70cf9e2acc8"
 BEARER_TOKEN = "AAAAAAAAAAAAAAAAAAAAANRILgAAAAAAnNwIzUejRCOuH5E6I8xnZz4puTs%3D1Zv7ttfk8LF81IUq16cHjhLTvJu4FA33AGWWjCpTnA"
 TWEET_COUNT = 20
+QUOTES_SUFFIX = "quotes"
+PRELOADED_STATE_MARKER = "window.__PRELOADED_STATE__ ="
+PRELOADED_STATE_CHUNK_SIZE = 16 * 1024
+JSON_DECODER = json.JSONDecoder()
+SEARCH_TIMELINE_RATE_LIMIT = RateLimiterProps(
+    "twitter.SearchTimeline", 50, 900.0, burst=50
+)
+
+
+def timeline_entry_lists(res: dict):
+    try:
+        instructions = res["data"]["search_by_raw_query"]["search_timeline"][
+            "timeline"
+        ]["instructions"]
+    except (KeyError, TypeError):
+        return []
+    return [
+        instruction["entries"]
+        for instruction in instructions
+        if "entries" in instruction
+    ]
+
+
+USER_FIELDS = {
+    "user_id_str": "legacy.user_id_str",
+    "name": "core.user_results.result.legacy.name",
+    "screen_name": "core.user_results.result.legacy.screen_name",
+    "description": "core.user_results.result.legacy.description",
+    "followers_count": "core.user_results.result.legacy.followers_count",
+    "friends_count": "core.user_results.result.legacy.friends_count",
+    "listed_count": "core.user_results.result.legacy.listed_count",
+    "user_created_at": "core.user_results.result.legacy.created_at",
+}
+TWEET_FIELDS = {
+    "id_str": "legacy.id_str",
+    "full_text": "legacy.full_text",
+    "created_at": "legacy.created_at",
+    "quote_count": "legacy.quote_count",
+    "reply_count": "legacy.reply_count",
+    "retweet_count": "legacy.retweet_count",
+    "favorite_count": "legacy.favorite_count",
+    "bookmark_count": "legacy.bookmark_count",
+    "views_count": "views.count",
+}
+TWEET_RESULT_PATH = "content.itemContent.tweet_results.result"
+TWEET_EXTRACTOR = Extractor(
+    {
+        "user": USER_FIELDS,
+        "tweet": {
+            **TWEET_FIELDS,
+            "expanded_url": Field("legacy.entities.urls.0.expanded_url", ""),
+        },
+    },
+    root=TWEET_RESULT_PATH,
+)
+QUOTE_EXTRACTOR = Extractor(
+    {"user": USER_FIELDS, "tweet": TWEET_FIELDS}, root=TWEET_RESULT_PATH
+)
+
+timeline_entries = compile_path(
+    "data.search_by_raw_query.search_timeline.timeline.instructions.0.entries", []
+)
+quoted_status_id = compile_path(TWEET_RESULT_PATH + ".legacy.quoted_status_id_str")
+
+
+def next_cursor(res: dict, cursor: str | None) -> str | None:
+    entries = timeline_entries(res)
+    if len(entries) == 0:
+        return None
+    bottom = entries[-1]
+    if bottom.get("entryId") != "cursor-bottom-0":
+        return None
+    if cursor == bottom["content"]["value"]:
+        return None
+    return bottom["content"]["value"]
+
+
+def pickup_cache_key(url: str) -> str:
+    parsed = parse.urlsplit(url)
+    return f"https://{parsed.netloc.lower()}{parsed.path.rstrip('/')}"
+
+
+def read_preloaded_state(chunks) -> dict | None:
+    # Decodes only the state object: text is scanned incrementally for the
+    # marker and decoded once a closing script tag has arrived after it
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    text = ""
+    found = False
+    checked = 0
+    for chunk in chunks:
+        text += decoder.decode(chunk)
+        if not found:
+            index = text.find(PRELOADED_STATE_MARKER)
+            if index < 0:
+                # Keep a tail in case the marker straddles two chunks
+                text = text[-len(PRELOADED_STATE_MARKER) :]
+                continue
+            text = text[index + len(PRELOADED_STATE_MARKER) :]
+            found = True
+        end = text.find("</script", checked)
+        if end < 0:
+            checked = max(0, len(text) - len("</script"))
+            continue
+        try:
+            state, _ = JSON_DECODER.raw_decode(text.lstrip())
+        except ValueError:
+            # The tag was inside a string of the object; keep reading
+            checked = end + 1
+            continue
+        return state
+    return None
+
+
+def pickup_headline(res: dict) -> dict | None:
+    try:
+        data = res["pageData"]
+        topic = res["topicsDetail"]
+        return {
+            "path": data["path"],
+            "topittl": data["pageParam"]["topittl"],
+            "topitime": data["pageParam"]["topitime"],
+            "title": topic["article"]["title"],
+            "description": data["description"],
+            "media_name": topic["article"]["mediaName"],
+            "pub_data": data["pubDate"],
+            "update_date": data["updateDate"],
+            "total_comment_count": res["commentShort"]["totalCommentCount"],
+        }
+    except (KeyError, TypeError):
+        return None
 
 
 class TwitterQuoteHandlerProps:
@@ -34,6 +175,12 @@ class TwitterQuoteHandlerProps:
         quote_min_favorite: int,
         request_count: int,
         quote_request_count: int,
+        max_workers: int = 1,
+        quote_max_workers: int = 1,
+        stream_quotes: bool = False,
+        headline_cache: CacheProps | None = None,
+        search_timeline_rate_limit: RateLimiterProps = SEARCH_TIMELINE_RATE_LIMIT,
+        sink: JsonlSinkProps | None = None,
     ):
         self.output_dir = output_dir
         self.handle_name = handle_name
@@ -47,6 +194,14 @@ class TwitterQuoteHandlerProps:
         self.quote_min_favorite = quote_min_favorite
         self.request_count = request_count
         self.quote_request_count = quote_request_count
+        self.max_workers = max_workers
+        self.quote_max_workers = quote_max_workers
+        self.stream_quotes = stream_quotes
+        self.headline_cache = (
+            headline_cache if headline_cache is not None else CacheProps()
+        )
+        self.search_timeline_rate_limit = search_timeline_rate_limit
+        self.sink = sink if sink is not None else JsonlSinkProps()
 
     def to_dict(self):
         return {
@@ -62,6 +217,12 @@ class TwitterQuoteHandlerProps:
             "quote_min_favorite": self.quote_min_favorite,
             "request_count": self.request_count,
             "quote_request_count": self.quote_request_count,
+            "max_workers": self.max_workers,
+            "quote_max_workers": self.quote_max_workers,
+            "stream_quotes": self.stream_quotes,
+            "headline_cache": self.headline_cache.to_dict(),
+            "search_timeline_rate_limit": self.search_timeline_rate_limit.to_dict(),
+            "sink": self.sink.to_dict(),
         }
 
     @staticmethod
@@ -79,6 +240,20 @@ class TwitterQuoteHandlerProps:
             quote_min_favorite=props["quote_min_favorite"],
             request_count=props["request_count"],
             quote_request_count=props["quote_request_count"],
+            max_workers=props.get("max_workers", 1),
+            quote_max_workers=props.get("quote_max_workers", 1),
+            stream_quotes=props.get("stream_quotes", False),
+            headline_cache=(
+                CacheProps.from_dict(props["headline_cache"])
+                if "headline_cache" in props
+                else None
+            ),
+            search_timeline_rate_limit=(
+                RateLimiterProps.from_dict(props["search_timeline_rate_limit"])
+                if "search_timeline_rate_limit" in props
+                else SEARCH_TIMELINE_RATE_LIMIT
+            ),
+            sink=JsonlSinkProps.from_dict(props["sink"]) if "sink" in props else None,
         )
 
 
@@ -86,27 +261,101 @@ class TwitterQuoteHandler:
     def __init__(self, props: TwitterQuoteHandlerProps):
         self.props = props
         self.logger = getLogger(__name__)
+        self.http = get_http_client()
+        self.search_timeline_limiter = get_rate_limiter(
+            self.props.search_timeline_rate_limit
+        )
+        self.sink = get_sink(
+            os.path.join(self.props.output_dir, self.props.handle_name),
+            self.props.sink,
+        )
+        self.raw_store = RawStore(self.sink)
+        self.fetched = get_fetched_store(
+            os.path.join(self.props.output_dir, self.props.handle_name, "fetched.jsonl")
+        )
+        self.headline_cache = get_cache(
+            os.path.join(
+                self.props.output_dir, self.props.handle_name, "headlines.sqlite"
+            ),
+            self.props.headline_cache,
+        )
+        if self.props.stream_quotes:
+            self.sink.depend(None, QUOTES_SUFFIX)
+        self.checkpoints = get_checkpoint_store(
+            os.path.join(
+                self.props.output_dir, self.props.handle_name, "checkpoints.json"
+            )
+        )
+        self.stats = RunStats()
+        self.__in_flight_lock = threading.Lock()
+        self.__in_flight: set[str] = set()
 
     def fetch(self):
-        for screen_name in self.props.screen_names:
-            self.__fetch_user_tweets(screen_name)
-
-    def __fetch_user_tweets(self, screen_name: str):
-        since_datetime = (
-            datetime.datetime.now()
-            - timedelta(days=self.props.delta_days)
-            - timedelta(hours=self.props.period_hours)
-        )
-        until_datetime = datetime.datetime.now() - timedelta(days=self.props.delta_days)
+        self.stats = RunStats()
+        self.__in_flight = set()
+        # Quote searches run in their own pool so a parent's pages never wait
+        # behind another parent's; the shared limiter caps both pools together
+        with ThreadPoolExecutor(
+            max_workers=self.props.quote_max_workers
+        ) as quote_executor, ThreadPoolExecutor(
+            max_workers=self.props.max_workers
+        ) as executor:
+            futures = [
+                executor.submit(self.__fetch_user_tweets, screen_name, quote_executor)
+                for screen_name in self.props.screen_names
+            ]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as ex:
+                    self.logger.error(ex)
+        self.sink.flush()
+        malformed = TWEET_EXTRACTOR.take_malformed() + QUOTE_EXTRACTOR.take_malformed()
+        if malformed > 0:
+            self.logger.warning("Skipped %d malformed timeline entries", malformed)
+        self.stats.add("malformed", malformed)
+        return self.stats.to_dict()
+
+    def __fetch_user_tweets(self, screen_name: str, quote_executor: ThreadPoolExecutor):
+        # An interrupted run resumes with the saved window and cursor, since a
+        # fresh window would not line up with the saved cursor
+        checkpoint_key = f"user_tweets:{screen_name}"
+        checkpoint = self.checkpoints.get(checkpoint_key)
+        if checkpoint is not None:
+            since_datetime = datetime.datetime.fromisoformat(checkpoint["since"])
+            until_datetime = datetime.datetime.fromisoformat(checkpoint["until"])
+            cursor = checkpoint["cursor"]
+            start_page = checkpoint["page"]
+            resumed = checkpoint.get("pending", [])
+            self.logger.info(f"Resuming {screen_name} from page {start_page}")
+        else:
+            since_datetime = (
+                datetime.datetime.now()
+                - timedelta(days=self.props.delta_days)
+                - timedelta(hours=self.props.period_hours)
+            )
+            until_datetime = datetime.datetime.now() - timedelta(
+                days=self.props.delta_days
+            )
+            cursor = None
+            start_page = 0
+            resumed = []
         with open(self.props.cookie_path, "r") as f:
             cookies_dict = json.load(f)
         cookies = RequestsCookieJar()
         for key, value in cookies_dict.items():
             cookies.set(key, value)
 
-        cursor = None
-        for _ in range(self.props.request_count):
-            time.sleep(15)
+        # Parents queued but not yet written ride along in the checkpoint, since
+        # a resumed run starts past the pages they were found on
+        pending: dict[str, dict] = {}
+        quote_futures = []
+        for item in resumed:
+            self.__submit_tweet(
+                item["tweet"], item["referer"], pending, quote_executor, quote_futures
+            )
+        completed = True
+        for page in range(start_page, self.props.request_count):
             query = (
                 "From:"
                 + screen_name
@@ -144,150 +393,109 @@ class TwitterQuoteHandler:
                 "x-twitter-auth-type": "OAuth2Session",
                 "x-twitter-client-language": "ja",
             }
-            content = requests.request(
-                "GET", url, headers=headers, data={}, cookies=cookies
-            )
-            self.logger.info(f"Request: {url}")
-            res = json.loads(content.text)
-            raw_output_path = os.path.join(
-                self.props.output_dir,
-                self.props.handle_name,
-                f"{date.today()}_raw.jsonl",
-            )
-            if not Path(raw_output_path).exists():
-                Path(raw_output_path).parent.mkdir(parents=True, exist_ok=True)
-                Path(raw_output_path).touch()
-            with open(raw_output_path, "a") as f:
-                json.dump(res, f, ensure_ascii=False)
-                f.write("\n")
-            for entry in res["data"]["search_by_raw_query"]["search_timeline"][
-                "timeline"
-            ]["instructions"][0]["entries"]:
+            res = self.__search_timeline(url, headers, cookies)
+            if res is None:
+                completed = False
+                break
+            for entry in timeline_entries(res):
                 try:
-                    if "itemContent" not in entry["content"]:
-                        continue
-                    if "tweet_results" not in entry["content"]["itemContent"]:
+                    tweet = TWEET_EXTRACTOR.extract(entry)
+                    if tweet is None:
                         continue
-                    tweet_result_legacy = entry["content"]["itemContent"][
-                        "tweet_results"
-                    ]["result"]["legacy"]
-                    user_result_legacy = entry["content"]["itemContent"][
-                        "tweet_results"
-                    ]["result"]["core"]["user_results"]["result"]["legacy"]
-
-                    user_id_str = tweet_result_legacy["user_id_str"]
-                    name = user_result_legacy["name"]
-                    screen_name = user_result_legacy["screen_name"]
-                    description = user_result_legacy["description"]
-                    followers_count = user_result_legacy["followers_count"]
-                    friends_count = user_result_legacy["friends_count"]
-                    listed_count = user_result_legacy["listed_count"]
-                    user_created_at = user_result_legacy["created_at"]
-
-                    id_str = tweet_result_legacy["id_str"]
-                    full_text = tweet_result_legacy["full_text"]
-                    created_at = tweet_result_legacy["created_at"]
-                    quote_count = tweet_result_legacy["quote_count"]
-                    reply_count = tweet_result_legacy["reply_count"]
-                    retweet_count = tweet_result_legacy["retweet_count"]
-                    favorite_count = tweet_result_legacy["favorite_count"]
-                    bookmark_count = tweet_result_legacy["bookmark_count"]
-                    views_count = entry["content"]["itemContent"]["tweet_results"][
-                        "result"
-                    ]["views"]["count"]
-
-                    expanded_url = ""
-                    if "urls" in tweet_result_legacy["entities"]:
-                        if len(tweet_result_legacy["entities"]["urls"]) > 0:
-                            expanded_url = tweet_result_legacy["entities"]["urls"][0][
-                                "expanded_url"
-                            ]
-                    fetched_output_path = os.path.join(
-                        self.props.output_dir,
-                        self.props.handle_name,
-                        "fetched.jsonl",
-                    )
-                    if not Path(fetched_output_path).exists():
-                        Path(fetched_output_path).parent.mkdir(
-                            parents=True, exist_ok=True
-                        )
-                        Path(fetched_output_path).touch()
-                    with open(fetched_output_path, "r") as f:
-                        fetched_ids = f.read().splitlines()
-                    if id_str in fetched_ids:
-                        continue
-                    with open(fetched_output_path, "a") as f:
-                        f.write(id_str + "\n")
-
-                    headline = {}
-                    if expanded_url.startswith("https://news.yahoo.co.jp/pickup/"):
-                        headline = self.__fetch_pickup_yahoo_news(expanded_url)
-
-                    timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
-
                     referer = (
                         "https://twitter.com/search?q="
                         + query
                         + "&src=typed_query&f=top"
                     )
-                    quotes = self.__fetch_quote_tweet(referer, id_str)
-
-                    tweet = {
-                        "user": {
-                            "user_id_str": user_id_str,
-                            "name": name,
-                            "screen_name": screen_name,
-                            "description": description,
-                            "followers_count": followers_count,
-                            "friends_count": friends_count,
-                            "listed_count": listed_count,
-                            "user_created_at": user_created_at,
-                        },
-                        "tweet": {
-                            "id_str": id_str,
-                            "full_text": full_text,
-                            "created_at": created_at,
-                            "quote_count": quote_count,
-                            "reply_count": reply_count,
-                            "retweet_count": retweet_count,
-                            "favorite_count": favorite_count,
-                            "bookmark_count": bookmark_count,
-                            "views_count": views_count,
-                            "expanded_url": expanded_url,
-                        },
-                        "quotes": quotes,
-                        "headline": headline,
-                        "timestamp": timestamp,
-                    }
-                    output_path = os.path.join(
-                        self.props.output_dir,
-                        self.props.handle_name,
-                        f"{date.today()}.jsonl",
+                    self.__submit_tweet(
+                        tweet, referer, pending, quote_executor, quote_futures
                     )
-                    if not Path(output_path).exists():
-                        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-                        Path(output_path).touch()
-                    with open(output_path, "a") as f:
-                        json.dump(tweet, f, ensure_ascii=False)
-                        f.write("\n")
                 except Exception as ex:
                     self.logger.error(ex)
                     continue
-            bottom = res["data"]["search_by_raw_query"]["search_timeline"]["timeline"][
-                "instructions"
-            ][0]["entries"][-1]
-            if "entryId" in bottom:
-                if bottom["entryId"] == "cursor-bottom-0":
-                    if cursor == bottom["content"]["value"]:
-                        cursor = None
-                        break
-                    cursor = bottom["content"]["value"]
-                else:
-                    cursor = None
-            else:
-                cursor = None
+            cursor = next_cursor(res, cursor)
             if cursor is None:
                 break
+            with self.__in_flight_lock:
+                pending_items = list(pending.values())
+            self.checkpoints.save(
+                checkpoint_key,
+                {
+                    "since": since_datetime.isoformat(),
+                    "until": until_datetime.isoformat(),
+                    "cursor": cursor,
+                    "page": page + 1,
+                    "pending": pending_items,
+                },
+            )
+        for future in as_completed(quote_futures):
+            try:
+                future.result()
+            except Exception as ex:
+                self.logger.error(ex)
+        if completed:
+            self.checkpoints.clear(checkpoint_key)
+
+    def __submit_tweet(
+        self,
+        tweet: dict,
+        referer: str,
+        pending: dict[str, dict],
+        quote_executor: ThreadPoolExecutor,
+        quote_futures: list,
+    ):
+        # Only flushed tweets count as fetched, so one that fails or is cut
+        # off is retried by a later run; the in-flight set dedups this run
+        id_str = tweet["tweet"]["id_str"]
+        with self.__in_flight_lock:
+            if id_str in self.__in_flight or self.fetched.contains(id_str):
+                return
+            self.__in_flight.add(id_str)
+            pending[id_str] = {"tweet": tweet, "referer": referer}
+        quote_futures.append(
+            quote_executor.submit(self.__complete_pending, tweet, referer, pending)
+        )
+
+    def __complete_pending(self, tweet: dict, referer: str, pending: dict[str, dict]):
+        id_str = tweet["tweet"]["id_str"]
+
+        def on_flush():
+            # The record may sit in the sink's buffer for a while; until it is
+            # in the file, later checkpoints keep it pending
+            self.fetched.add(id_str)
+            with self.__in_flight_lock:
+                pending.pop(id_str, None)
+
+        self.__complete_tweet(tweet, referer, on_flush)
+
+    def __complete_tweet(self, tweet: dict, referer: str, on_flush=None):
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+        expanded_url = tweet["tweet"]["expanded_url"]
+        headline = {}
+        if expanded_url.startswith("https://news.yahoo.co.jp/pickup/"):
+            headline = self.__fetch_pickup_yahoo_news(expanded_url)
+        quotes = self.__fetch_quote_tweet(referer, tweet["tweet"]["id_str"])
+        if self.props.stream_quotes:
+            # Quotes go to their own stream page by page, keyed by parent, and
+            # the parent keeps only a count and the stream's file name
+            quotes_path = os.path.basename(self.sink.path(QUOTES_SUFFIX))
+            quotes_count = 0
+            for quote in quotes:
+                self.sink.write(
+                    {"parent_id_str": tweet["tweet"]["id_str"], **quote},
+                    QUOTES_SUFFIX,
+                )
+                quotes_count += 1
+            self.stats.add("quotes", quotes_count)
+            tweet["quotes_count"] = quotes_count
+            tweet["quotes_path"] = quotes_path
+        else:
+            tweet["quotes"] = list(quotes)
+            self.stats.add("quotes", len(tweet["quotes"]))
+        tweet["headline"] = headline
+        tweet["timestamp"] = timestamp
+        self.sink.write(tweet, on_flush=on_flush)
+        self.stats.add("items")
 
     def __fetch_quote_tweet(self, referer, tweet_id):
         with open(self.props.cookie_path, "r") as f:
@@ -296,11 +504,8 @@ class TwitterQuoteHandler:
         for key, value in cookies_dict.items():
             cookies.set(key, value)
 
-        quotes = []
-
         cursor = None
         for _ in range(self.props.quote_request_count):
-            time.sleep(15)
             url = (
                 'https://twitter.com/i/api/graphql/lZ0GCEojmtQfiUQa5oJSEw/SearchTimeline?variables={"rawQuery":"quoted_tweet_id:'
                 + tweet_id
@@ -328,107 +533,51 @@ class TwitterQuoteHandler:
                 "x-twitter-auth-type": "OAuth2Session",
                 "x-twitter-client-language": "ja",
             }
-            content = requests.request(
-                "GET", url, headers=headers, data={}, cookies=cookies
-            )
-            self.logger.info(f"Request: {url}")
-            res = json.loads(content.text)
-            raw_output_path = os.path.join(
-                self.props.output_dir,
-                self.props.handle_name,
-                f"{date.today()}_raw.jsonl",
-            )
-            if not Path(raw_output_path).exists():
-                Path(raw_output_path).parent.mkdir(parents=True, exist_ok=True)
-                Path(raw_output_path).touch()
-            with open(raw_output_path, "a") as f:
-                json.dump(res, f, ensure_ascii=False)
-                f.write("\n")
-            for entry in res["data"]["search_by_raw_query"]["search_timeline"][
-                "timeline"
-            ]["instructions"][0]["entries"]:
+            res = self.__search_timeline(url, headers, cookies)
+            if res is None:
+                break
+            for entry in timeline_entries(res):
                 try:
-                    if "itemContent" not in entry["content"]:
-                        continue
-                    if "tweet_results" not in entry["content"]["itemContent"]:
+                    quote = QUOTE_EXTRACTOR.extract(entry)
+                    if quote is None:
                         continue
-                    tweet_result_legacy = entry["content"]["itemContent"][
-                        "tweet_results"
-                    ]["result"]["legacy"]
-                    user_result_legacy = entry["content"]["itemContent"][
-                        "tweet_results"
-                    ]["result"]["core"]["user_results"]["result"]["legacy"]
-
-                    user_id_str = tweet_result_legacy["user_id_str"]
-                    name = user_result_legacy["name"]
-                    screen_name = user_result_legacy["screen_name"]
-                    description = user_result_legacy["description"]
-                    followers_count = user_result_legacy["followers_count"]
-                    friends_count = user_result_legacy["friends_count"]
-                    listed_count = user_result_legacy["listed_count"]
-                    user_created_at = user_result_legacy["created_at"]
-
-                    id_str = tweet_result_legacy["id_str"]
-                    full_text = tweet_result_legacy["full_text"]
-                    created_at = tweet_result_legacy["created_at"]
-                    quote_count = tweet_result_legacy["quote_count"]
-                    reply_count = tweet_result_legacy["reply_count"]
-                    retweet_count = tweet_result_legacy["retweet_count"]
-                    favorite_count = tweet_result_legacy["favorite_count"]
-                    bookmark_count = tweet_result_legacy["bookmark_count"]
-                    views_count = entry["content"]["itemContent"]["tweet_results"][
-                        "result"
-                    ]["views"]["count"]
-
-                    timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
-
-                    quotes.append(
-                        {
-                            "user": {
-                                "user_id_str": user_id_str,
-                                "name": name,
-                                "screen_name": screen_name,
-                                "description": description,
-                                "followers_count": followers_count,
-                                "friends_count": friends_count,
-                                "listed_count": listed_count,
-                                "user_created_at": user_created_at,
-                            },
-                            "tweet": {
-                                "id_str": id_str,
-                                "full_text": full_text,
-                                "created_at": created_at,
-                                "quote_count": quote_count,
-                                "reply_count": reply_count,
-                                "retweet_count": retweet_count,
-                                "favorite_count": favorite_count,
-                                "bookmark_count": bookmark_count,
-                                "views_count": views_count,
-                            },
-                            "timestamp": timestamp,
-                        }
+                    quote["timestamp"] = datetime.datetime.now().strftime(
+                        "%Y-%m-%dT%H:%M:%SZ"
                     )
+                    yield quote
                 except Exception as ex:
                     self.logger.error(ex)
                     continue
-            bottom = res["data"]["search_by_raw_query"]["search_timeline"]["timeline"][
-                "instructions"
-            ][0]["entries"][-1]
-            if "entryId" in bottom:
-                if bottom["entryId"] == "cursor-bottom-0":
-                    if cursor == bottom["content"]["value"]:
-                        cursor = None
-                        break
-                    cursor = bottom["content"]["value"]
-                else:
-                    cursor = None
-            else:
-                cursor = None
+            cursor = next_cursor(res, cursor)
             if cursor is None:
                 break
-        return quotes
+
+    def __search_timeline(self, url, headers, cookies):
+        content = self.http.request(
+            "GET",
+            url,
+            limiter=self.search_timeline_limiter,
+            headers=headers,
+            data={},
+            cookies=cookies,
+        )
+        self.logger.info(f"Request: {url}")
+        self.stats.add("requests")
+        if content.status_code != 200:
+            self.logger.error(f"SearchTimeline failed: HTTP {content.status_code}")
+            return None
+        res = loads(content.content)
+        self.raw_store.put(res, "raw", timeline_entry_lists)
+        if "data" not in res or "search_by_raw_query" not in res["data"]:
+            self.logger.error(f"SearchTimeline failed: {res.get('errors')}")
+            return None
+        return res
 
     def __fetch_pickup_yahoo_news(self, url):
+        key = pickup_cache_key(url)
+        hit, headline = self.headline_cache.get(key)
+        if hit:
+            return headline if headline is not None else {}
         try:
             headers = {
                 "authority": "news.yahoo.co.jp",
@@ -437,44 +586,29 @@ class TwitterQuoteHandler:
                 "referer": url,
                 "user-agent": USER_AGENT,
             }
-            content = requests.request("GET", url, headers=headers, data={})
-            self.logger.info(f"Request: {url}")
-            scripts = re.compile(r"<script.*?>(.*?)</script>", re.DOTALL).findall(
-                content.text
-            )
-            res = None
-            for script in scripts:
-                if "__PRELOADED_STATE__" not in script:
-                    continue
-                script = script.replace("window.__PRELOADED_STATE__ = ", "")
-                res = json.loads(script)
-                break
-            if res is None:
-                return {}
-
-            data = res["pageData"]
-            topic = res["topicsDetail"]
-
-            path = data["path"]
-            topittl = data["pageParam"]["topittl"]
-            topitime = data["pageParam"]["topitime"]
-            title = topic["article"]["title"]
-            description = data["description"]
-            media_name = topic["article"]["mediaName"]
-            pub_data = data["pubDate"]
-            update_date = data["updateDate"]
-            total_comment_count = res["commentShort"]["totalCommentCount"]
-            return {
-                "path": path,
-                "topittl": topittl,
-                "topitime": topitime,
-                "title": title,
-                "description": description,
-                "media_name": media_name,
-                "pub_data": pub_data,
-                "update_date": update_date,
-                "total_comment_count": total_comment_count,
-            }
+            with self.http.request(
+                "GET", url, headers=headers, data={}, stream=True
+            ) as content:
+                self.logger.info(f"Request: {url}")
+                self.stats.add("requests")
+                if content.status_code != 200:
+                    # Error pages are retried by a later tweet rather than
+                    # cached as pages without a headline
+                    self.logger.error(
+                        f"Pickup failed: HTTP {content.status_code}: {url}"
+                    )
+                    return {}
+                # Leaving the block closes the connection without reading the
+                # rest of the page
+                state = read_preloaded_state(
+                    self.http.iter_content(content, PRELOADED_STATE_CHUNK_SIZE)
+                )
         except Exception as ex:
+            # Network failures are transient and not cached
             self.logger.error(ex)
             return {}
+        headline = pickup_headline(state) if state is not None else None
+        if headline is None:
+            self.logger.warning(f"Headline not found: {url}")
+        self.headline_cache.put(key, headline)
+        return headline if headline is not None else {}
@@ -1,12 +1,76 @@
-import json
 import os
-from datetime import date, datetime, timedelta
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 from logging import getLogger
-from pathlib import Path
-from time import sleep
 from urllib import parse
 
-import requests
+from util.checkpoint_store import get_checkpoint_store
+from util.fetched_store import get_fetched_store
+from util.http_client import get_http_client
+from util.quota import QuotaPlanner, QuotaProps
+from util.raw_store import RawStore
+from util.rate_limiter import RateLimiterProps, get_rate_limiter
+from util.redact import redact
+from util.run_stats import RunStats
+from util.serializer import loads
+from util.sink import JsonlSinkProps, get_sink
+
+VIDEO_BATCH_SIZE = 50
+SEARCH_RATE_LIMIT = RateLimiterProps("youtube.search", 1, 1.0)
+VIDEOS_RATE_LIMIT = RateLimiterProps("youtube.videos", 5, 1.0)
+COMMENT_THREADS_RATE_LIMIT = RateLimiterProps("youtube.commentThreads", 5, 1.0)
+PLAYLIST_ITEMS_RATE_LIMIT = RateLimiterProps("youtube.playlistItems", 5, 1.0)
+DISCOVERY_MODES = ["search", "uploads"]
+# Quota units per request and items per page from the Data API v3 docs
+SEARCH_COST = 100
+CHANNELS_COST = 1
+PLAYLIST_ITEMS_COST = 1
+VIDEOS_COST = 1
+COMMENT_THREADS_COST = 1
+COMMENT_PAGE_SIZE = 100
+# Uploads paging stops on its own at the window or the first video already
+# fetched; this only bounds a channel that uploads far more than usual
+UPLOADS_MAX_PAGES = 20
+
+
+def item_lists(res: dict):
+    return [res["items"]] if "items" in res else []
+
+
+def build_video(item: dict, comments: list[dict]) -> dict:
+    video = {
+        "video": {
+            "id": item["id"],
+            "title": item["snippet"]["title"],
+            "description": item["snippet"]["description"],
+            "channel_title": item["snippet"]["channelTitle"],
+            "category_id": item["snippet"]["categoryId"],
+            "view_count": item["statistics"]["viewCount"],
+            "like_count": item["statistics"]["likeCount"],
+            "favorite_count": item["statistics"]["favoriteCount"],
+        },
+        "comments": comments,
+        "timestamp": datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+    if "tags" in item["snippet"]:
+        video["video"]["tags"] = item["snippet"]["tags"]
+    if "commentCount" in item["statistics"]:
+        video["video"]["comment_count"] = item["statistics"]["commentCount"]
+    return video
+
+
+def extract_comment(item: dict) -> dict:
+    snippet = item["snippet"]["topLevelComment"]["snippet"]
+    return {
+        "comment_id": item["id"],
+        "text": snippet["textDisplay"],
+        "author_display_name": snippet["authorDisplayName"],
+        "author_channel_id": snippet["authorChannelId"]["value"],
+        "like_count": snippet["likeCount"],
+        "published_at": snippet["publishedAt"],
+        "updated_at": snippet["updatedAt"],
+    }
 
 
 class YouTubeHandlerProps:
@@ -20,6 +84,14 @@ class YouTubeHandlerProps:
         period_days: int,
         request_count: int,
         comment_request_count: int,
+        max_workers: int = 1,
+        search_rate_limit: RateLimiterProps = SEARCH_RATE_LIMIT,
+        videos_rate_limit: RateLimiterProps = VIDEOS_RATE_LIMIT,
+        comment_threads_rate_limit: RateLimiterProps = COMMENT_THREADS_RATE_LIMIT,
+        sink: JsonlSinkProps | None = None,
+        quota: QuotaProps | None = None,
+        discovery: str = "search",
+        playlist_items_rate_limit: RateLimiterProps = PLAYLIST_ITEMS_RATE_LIMIT,
     ):
         self.output_dir = output_dir
         self.handle_name = handle_name
@@ -29,6 +101,14 @@ class YouTubeHandlerProps:
         self.period_days = period_days
         self.request_count = request_count
         self.comment_request_count = comment_request_count
+        self.max_workers = max_workers
+        self.search_rate_limit = search_rate_limit
+        self.videos_rate_limit = videos_rate_limit
+        self.comment_threads_rate_limit = comment_threads_rate_limit
+        self.sink = sink if sink is not None else JsonlSinkProps()
+        self.quota = quota
+        self.discovery = discovery
+        self.playlist_items_rate_limit = playlist_items_rate_limit
 
     def to_dict(self):
         return {
@@ -40,6 +120,14 @@ class YouTubeHandlerProps:
             "period_days": self.period_days,
             "request_count": self.request_count,
             "comment_request_count": self.comment_request_count,
+            "max_workers": self.max_workers,
+            "search_rate_limit": self.search_rate_limit.to_dict(),
+            "videos_rate_limit": self.videos_rate_limit.to_dict(),
+            "comment_threads_rate_limit": self.comment_threads_rate_limit.to_dict(),
+            "sink": self.sink.to_dict(),
+            "quota": self.quota.to_dict() if self.quota is not None else None,
+            "discovery": self.discovery,
+            "playlist_items_rate_limit": self.playlist_items_rate_limit.to_dict(),
         }
 
     @staticmethod
@@ -53,116 +141,295 @@ class YouTubeHandlerProps:
             props["period_days"],
             props["request_count"],
             props["comment_request_count"],
+            props.get("max_workers", 1),
+            (
+                RateLimiterProps.from_dict(props["search_rate_limit"])
+                if "search_rate_limit" in props
+                else SEARCH_RATE_LIMIT
+            ),
+            (
+                RateLimiterProps.from_dict(props["videos_rate_limit"])
+                if "videos_rate_limit" in props
+                else VIDEOS_RATE_LIMIT
+            ),
+            (
+                RateLimiterProps.from_dict(props["comment_threads_rate_limit"])
+                if "comment_threads_rate_limit" in props
+                else COMMENT_THREADS_RATE_LIMIT
+            ),
+            (JsonlSinkProps.from_dict(props["sink"]) if "sink" in props else None),
+            (
+                QuotaProps.from_dict(props["quota"])
+                if props.get("quota") is not None
+                else None
+            ),
+            props.get("discovery", "search"),
+            (
+                RateLimiterProps.from_dict(props["playlist_items_rate_limit"])
+                if "playlist_items_rate_limit" in props
+                else PLAYLIST_ITEMS_RATE_LIMIT
+            ),
         )
 
 
 class YouTubeHandler:
     def __init__(self, props: YouTubeHandlerProps):
+        if props.discovery not in DISCOVERY_MODES:
+            raise ValueError(f"Unknown discovery mode: {props.discovery}")
         self.props = props
         self.logger = getLogger(__name__)
+        self.http = get_http_client()
+        self.search_limiter = get_rate_limiter(self.props.search_rate_limit)
+        self.videos_limiter = get_rate_limiter(self.props.videos_rate_limit)
+        self.comment_threads_limiter = get_rate_limiter(
+            self.props.comment_threads_rate_limit
+        )
+        self.playlist_items_limiter = get_rate_limiter(
+            self.props.playlist_items_rate_limit
+        )
+        self.__uploads_lock = threading.Lock()
+        self.__uploads_playlist_ids: dict[str, str] = {}
+        self.sink = get_sink(
+            os.path.join(self.props.output_dir, self.props.handle_name),
+            self.props.sink,
+        )
+        self.raw_store = RawStore(self.sink)
+        self.fetched = get_fetched_store(
+            os.path.join(self.props.output_dir, self.props.handle_name, "fetched.yaml")
+        )
+        self.checkpoints = get_checkpoint_store(
+            os.path.join(
+                self.props.output_dir, self.props.handle_name, "checkpoints.json"
+            )
+        )
+        self.stats = RunStats()
 
     def fetch(self):
-        for channel_id in self.props.channel_ids:
-            self.__fetch_channel(channel_id)
+        self.stats = RunStats()
+        # Channels are searched first so comment pages can be planned across
+        # every new video of the run before any are spent
+        planner = QuotaPlanner(self.props.quota) if self.props.quota else None
+        # Uploads are listed newest first, so the pages before the window are
+        # walked too; request_count sizes search windows and would stop short
+        # of it once delta_days pushes the window back
+        if self.props.discovery == "search":
+            search_pages, page_cost = self.props.request_count, SEARCH_COST
+        else:
+            search_pages, page_cost = UPLOADS_MAX_PAGES, PLAYLIST_ITEMS_COST
+        if planner is not None:
+            search_pages = planner.pages_per_query(
+                len(self.props.channel_ids), page_cost, search_pages
+            )
+        items = {}
+        with ThreadPoolExecutor(max_workers=self.props.max_workers) as executor:
+            futures = [
+                executor.submit(self.__fetch_channel, channel_id, search_pages, planner)
+                for channel_id in self.props.channel_ids
+            ]
+            for future in as_completed(futures):
+                try:
+                    for item in future.result():
+                        items[item["id"]] = item
+                except Exception as ex:
+                    self.logger.error(ex)
+
+            comment_pages = {
+                video_id: self.props.comment_request_count for video_id in items
+            }
+            if planner is not None:
+                comment_pages = planner.allocate(
+                    {
+                        video_id: int(item["statistics"].get("commentCount", 0))
+                        for video_id, item in items.items()
+                    },
+                    COMMENT_PAGE_SIZE,
+                    COMMENT_THREADS_COST,
+                    self.props.comment_request_count,
+                )
+            futures = [
+                executor.submit(
+                    self.__fetch_video, item, comment_pages[video_id], planner
+                )
+                for video_id, item in items.items()
+            ]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as ex:
+                    self.logger.error(ex)
+        self.sink.flush()
+        return self.stats.to_dict()
+
+    def __fetch_channel(
+        self, channel_id: str, search_pages: int, planner: QuotaPlanner | None
+    ) -> list[dict]:
+        if self.props.discovery == "uploads":
+            pages = self.__iter_upload_pages(channel_id, search_pages, planner)
+        else:
+            pages = self.__iter_search_pages(channel_id, search_pages, planner)
+        items = []
+        for video_ids in pages:
+            for i in range(0, len(video_ids), VIDEO_BATCH_SIZE):
+                batch_ids = video_ids[i : i + VIDEO_BATCH_SIZE]
+                detail = self.__videos_by_ids(batch_ids)
+                if planner is not None:
+                    planner.spend(VIDEOS_COST)
+                self.raw_store.put(detail, "detail_raw", item_lists)
+                details = {item["id"]: item for item in detail.get("items", [])}
+                for video_id in batch_ids:
+                    if video_id not in details:
+                        self.logger.warning(f"Video not found: {video_id}")
+                        continue
+                    items.append(details[video_id])
+        return items
 
-    def __fetch_channel(self, channel_id: str):
+    def __window(self) -> tuple[datetime, datetime]:
         published_after = (
             datetime.today()
             - timedelta(days=self.props.delta_days)
             - timedelta(days=self.props.period_days)
         )
         published_before = datetime.now() - timedelta(days=self.props.delta_days)
-        page_token = None
-        for _ in range(self.props.request_count):
-            sleep(5)
+        return published_after, published_before
+
+    def __iter_search_pages(
+        self, channel_id: str, search_pages: int, planner: QuotaPlanner | None
+    ):
+        # Page tokens are only valid for the window they were issued in, so an
+        # interrupted run resumes with the saved window
+        checkpoint_key = f"channel:{channel_id}"
+        checkpoint = self.checkpoints.get(checkpoint_key)
+        if checkpoint is not None:
+            published_after = datetime.fromisoformat(checkpoint["published_after"])
+            published_before = datetime.fromisoformat(checkpoint["published_before"])
+            page_token = checkpoint["page_token"]
+            start_page = checkpoint["page"]
+            self.logger.info(f"Resuming {channel_id} from page {start_page}")
+        else:
+            published_after, published_before = self.__window()
+            page_token = None
+            start_page = 0
+        for page in range(start_page, search_pages):
             res = self.__search_by_channel_id(
                 channel_id, page_token, published_after, published_before
             )
-            self.__append_to_output(res, "raw")
+            if planner is not None:
+                planner.spend(SEARCH_COST)
+            self.raw_store.put(res, "raw", item_lists)
+            video_ids = []
             for item in res["items"]:
                 try:
                     video_id = item["id"]["videoId"]
-                    if self.__is_fetched(video_id):
+                    if self.fetched.contains(video_id) or video_id in video_ids:
                         continue
-                    self.__append_to_fetched(video_id)
-                    detail = self.__video_by_id(video_id)
-                    self.__append_to_output(detail, "detail_raw")
-                    video = {
-                        "video": {
-                            "id": video_id,
-                            "title": detail["items"][0]["snippet"]["title"],
-                            "description": detail["items"][0]["snippet"]["description"],
-                            "channel_title": detail["items"][0]["snippet"][
-                                "channelTitle"
-                            ],
-                            "category_id": detail["items"][0]["snippet"]["categoryId"],
-                            "view_count": detail["items"][0]["statistics"]["viewCount"],
-                            "like_count": detail["items"][0]["statistics"]["likeCount"],
-                            "favorite_count": detail["items"][0]["statistics"][
-                                "favoriteCount"
-                            ],
-                        },
-                        "comments": self.__fetch_comments(video_id),
-                        "timestamp": datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
-                    }
-                    if "tags" in detail["items"][0]["snippet"]:
-                        video["video"]["tags"] = detail["items"][0]["snippet"]["tags"]
-                    if "commentCount" in detail["items"][0]["statistics"]:
-                        video["video"]["comment_count"] = detail["items"][0][
-                            "statistics"
-                        ]["commentCount"]
-                    self.__append_to_output(video)
+                    video_ids.append(video_id)
                 except Exception as ex:
                     self.logger.error(ex)
                     continue
+            yield video_ids
             if "nextPageToken" in res:
                 page_token = res["nextPageToken"]
             else:
                 page_token = None
             if page_token is None:
                 break
+            self.checkpoints.save(
+                checkpoint_key,
+                {
+                    "published_after": published_after.isoformat(),
+                    "published_before": published_before.isoformat(),
+                    "page_token": page_token,
+                    "page": page + 1,
+                },
+            )
+        self.checkpoints.clear(checkpoint_key)
 
-    def __fetch_comments(self, video_id: str):
+    def __iter_upload_pages(
+        self, channel_id: str, max_pages: int, planner: QuotaPlanner | None
+    ):
+        # Uploads are listed newest first, so everything past the first video
+        # already fetched or older than the window has been seen before; the
+        # window is applied here with the same bounds search.list would use
+        published_after, published_before = self.__window()
+        after = published_after.strftime("%Y-%m-%dT%H:%M:%SZ")
+        before = published_before.strftime("%Y-%m-%dT%H:%M:%SZ")
+        playlist_id = self.__uploads_playlist_id(channel_id, planner)
+        page_token = None
+        for _ in range(max_pages):
+            res = self.__playlist_items_by_playlist_id(playlist_id, page_token)
+            if planner is not None:
+                planner.spend(PLAYLIST_ITEMS_COST)
+            self.raw_store.put(res, "playlist_raw", item_lists)
+            video_ids = []
+            reached_seen = False
+            for item in res.get("items", []):
+                try:
+                    video_id = item["contentDetails"]["videoId"]
+                    published_at = item["contentDetails"].get(
+                        "videoPublishedAt", item["snippet"]["publishedAt"]
+                    )
+                except Exception as ex:
+                    self.logger.error(ex)
+                    continue
+                if published_at >= before:
+                    continue
+                if published_at < after or self.fetched.contains(video_id):
+                    reached_seen = True
+                    break
+                if video_id not in video_ids:
+                    video_ids.append(video_id)
+            yield video_ids
+            page_token = res.get("nextPageToken")
+            if reached_seen or page_token is None:
+                break
+
+    def __uploads_playlist_id(
+        self, channel_id: str, planner: QuotaPlanner | None
+    ) -> str:
+        with self.__uploads_lock:
+            if channel_id not in self.__uploads_playlist_ids:
+                res = self.__channels_by_id(channel_id)
+                if planner is not None:
+                    planner.spend(CHANNELS_COST)
+                self.__uploads_playlist_ids[channel_id] = res["items"][0][
+                    "contentDetails"
+                ]["relatedPlaylists"]["uploads"]
+            return self.__uploads_playlist_ids[channel_id]
+
+    def __fetch_video(
+        self, item: dict, comment_pages: int, planner: QuotaPlanner | None
+    ):
+        # Marked fetched only once flushed, so videos found by a run that dies
+        # before its comment phase are picked up again; the run itself has
+        # already deduped them by id
+        if self.fetched.contains(item["id"]):
+            return
+        # Built before any comment page is spent, so a detail that does not
+        # fit the record fails without costing comment quota on every run
+        video = build_video(item, [])
+        video["comments"] = self.__fetch_comments(item["id"], comment_pages, planner)
+        self.sink.write(video, on_flush=lambda: self.fetched.add(item["id"]))
+        self.stats.add("items")
+        self.stats.add("comments", len(video["comments"]))
+
+    def __fetch_comments(
+        self, video_id: str, comment_pages: int, planner: QuotaPlanner | None
+    ):
         comments = []
-        comment_ids = []
+        comment_ids = set()
         page_token = None
-        for _ in range(self.props.comment_request_count):
-            sleep(5)
-            res = self.__comment_threads_by_video_id(video_id)
-            self.__append_to_output(res, "comment_raw")
+        for _ in range(comment_pages):
+            res = self.__comment_threads_by_video_id(video_id, page_token)
+            if planner is not None:
+                planner.spend(COMMENT_THREADS_COST)
+            self.raw_store.put(res, "comment_raw", item_lists)
             for item in res["items"]:
                 try:
-                    comment_id = item["id"]
-                    text = item["snippet"]["topLevelComment"]["snippet"]["textDisplay"]
-                    author_display_name = item["snippet"]["topLevelComment"]["snippet"][
-                        "authorDisplayName"
-                    ]
-                    author_channel_id = item["snippet"]["topLevelComment"]["snippet"][
-                        "authorChannelId"
-                    ]["value"]
-                    like_count = item["snippet"]["topLevelComment"]["snippet"][
-                        "likeCount"
-                    ]
-                    published_at = item["snippet"]["topLevelComment"]["snippet"][
-                        "publishedAt"
-                    ]
-                    updated_at = item["snippet"]["topLevelComment"]["snippet"][
-                        "updatedAt"
-                    ]
-                    if comment_id in comment_ids:
+                    comment = extract_comment(item)
+                    if comment["comment_id"] in comment_ids:
                         continue
-                    comment_ids.append(comment_id)
-                    comments.append(
-                        {
-                            "comment_id": comment_id,
-                            "text": text,
-                            "author_display_name": author_display_name,
-                            "author_channel_id": author_channel_id,
-                            "like_count": like_count,
-                            "published_at": published_at,
-                            "updated_at": updated_at,
-                        }
-                    )
+                    comment_ids.add(comment["comment_id"])
+                    comments.append(comment)
                 except Exception as ex:
                     self.logger.error(ex)
                     continue
@@ -196,22 +463,56 @@ class YouTubeHandler:
         if published_before is not None:
             payload["publishedBefore"] = published_before.strftime("%Y-%m-%dT%H:%M:%SZ")
         url += parse.urlencode(payload)
-        content = requests.request("GET", url)
-        self.logger.info(f"Request: {url}")
-        res = json.loads(content.text)
+        content = self.http.request("GET", url, limiter=self.search_limiter)
+        self.logger.info(f"Request: {redact(url)}")
+        self.stats.add("requests")
+        res = loads(content.content)
+        return res
+
+    def __channels_by_id(self, channel_id: str):
+        url = "https://www.googleapis.com/youtube/v3/channels?"
+        payload = {
+            "key": self.props.api_key,
+            "part": "contentDetails",
+            "id": channel_id,
+        }
+        url += parse.urlencode(payload)
+        content = self.http.request("GET", url, limiter=self.playlist_items_limiter)
+        self.logger.info(f"Request: {redact(url)}")
+        self.stats.add("requests")
+        res = loads(content.content)
         return res
 
-    def __video_by_id(self, video_id: str):
+    def __playlist_items_by_playlist_id(
+        self, playlist_id: str, page_token: str | None = None
+    ):
+        url = "https://www.googleapis.com/youtube/v3/playlistItems?"
+        payload = {
+            "key": self.props.api_key,
+            "part": "snippet,contentDetails",
+            "playlistId": playlist_id,
+            "maxResults": 50,
+            "pageToken": "" if page_token is None else page_token,
+        }
+        url += parse.urlencode(payload)
+        content = self.http.request("GET", url, limiter=self.playlist_items_limiter)
+        self.logger.info(f"Request: {redact(url)}")
+        self.stats.add("requests")
+        res = loads(content.content)
+        return res
+
+    def __videos_by_ids(self, video_ids: list[str]):
         url = "https://www.googleapis.com/youtube/v3/videos?"
         payload = {
             "key": self.props.api_key,
             "part": "contentDetails,id,liveStreamingDetails,localizations,player,recordingDetails,snippet,statistics,status,topicDetails",
-            "id": video_id,
+            "id": ",".join(video_ids),
         }
         url += parse.urlencode(payload)
-        content = requests.request("GET", url)
-        self.logger.info(f"Request: {url}")
-        res = json.loads(content.text)
+        content = self.http.request("GET", url, limiter=self.videos_limiter)
+        self.logger.info(f"Request: {redact(url)}")
+        self.stats.add("requests")
+        res = loads(content.content)
         return res
 
     def __comment_threads_by_video_id(
@@ -228,44 +529,8 @@ class YouTubeHandler:
             "textFormat": "plainText",
         }
         url += parse.urlencode(payload)
-        content = requests.request("GET", url)
-        self.logger.info(f"Request: {url}")
-        res = json.loads(content.text)
+        content = self.http.request("GET", url, limiter=self.comment_threads_limiter)
+        self.logger.info(f"Request: {redact(url)}")
+        self.stats.add("requests")
+        res = loads(content.content)
         return res
-
-    def __append_to_output(self, data: dict, suffix: str | None = None):
-        output_path = os.path.join(
-            self.props.output_dir,
-            self.props.handle_name,
-            f"{date.today()}{'_' + suffix if suffix is not None else ''}.jsonl",
-        )
-        if not Path(output_path).exists():
-            Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-            Path(output_path).touch()
-        with open(output_path, "a") as f:
-            json.dump(data, f, ensure_ascii=False)
-            f.write("\n")
-
-    def __is_fetched(self, id_str: str, suffix: str | None = None):
-        fetched_output_path = os.path.join(
-            self.props.output_dir,
-            self.props.handle_name,
-            f"fetched{'_' + suffix if suffix is not None else ''}.yaml",
-        )
-        if not Path(fetched_output_path).exists():
-            return False
-        with open(fetched_output_path, "r") as f:
-            fetched_ids = f.read().splitlines()
-        return id_str in fetched_ids
-
-    def __append_to_fetched(self, id_str: str, suffix: str | None = None):
-        fetched_output_path = os.path.join(
-            self.props.output_dir,
-            self.props.handle_name,
-            f"fetched{'_' + suffix if suffix is not None else ''}.yaml",
-        )
-        if not Path(fetched_output_path).exists():
-            Path(fetched_output_path).parent.mkdir(parents=True, exist_ok=True)
-            Path(fetched_output_path).touch()
-        with open(fetched_output_path, "a") as f:
-            f.write(id_str + "\n")
@@ -1,6 +1,5 @@
 import logging
 import os
-import threading
 import time
 from datetime import datetime
 from os.path import abspath, dirname, join
@@ -9,14 +8,18 @@ from pathlib import Path
 import schedule
 from dotenv import load_dotenv
 
+from batch.birdwatch_delta import BirdwatchDeltaBatch, BirdwatchDeltaBatchProps
+from batch.birdwatch_parquet import BirdwatchParquetBatch, BirdwatchParquetBatchProps
 from batch.birdwatch_ref import BirdwatchRefBatch, BirdwatchRefBatchProps
 from handler.birdwatch_raw import BirdwatchRawHandler, BirdwatchRawHandlerProps
 from handler.twitter_quote import TwitterQuoteHandler, TwitterQuoteHandlerProps
 from handler.youtube import YouTubeHandler, YouTubeHandlerProps
-
-
-def run_concurrently(job):
-    threading.Thread(target=job).start()
+from util.http_client import HttpClientProps, configure_http_client
+from util.metrics import MetricsServerProps, start_metrics_server
+from util.quota import QuotaProps
+from util.redact import RedactFilter
+from util.scheduler import Scheduler, SchedulerProps
+from util.sink import JsonlSinkProps
 
 
 def get_youtube_handler() -> YouTubeHandler:
@@ -38,6 +41,19 @@ def get_youtube_handler() -> YouTubeHandler:
         period_days=1,
         request_count=3,
         comment_request_count=50,
+        max_workers=4,
+        sink=JsonlSinkProps(
+            compression="gzip",
+            compress_suffixes=[
+                "raw_objects",
+                "raw_refs",
+                "detail_raw_refs",
+                "comment_raw_refs",
+                "playlist_raw_refs",
+            ],
+        ),
+        quota=QuotaProps(daily_units=10_000, runs_per_day=24),
+        discovery="uploads",
     )
     return YouTubeHandler(props)
 
@@ -57,6 +73,11 @@ def get_twitter_quote_handler() -> TwitterQuoteHandler:
         quote_min_favorite=0,
         request_count=3,
         quote_request_count=10,
+        max_workers=3,
+        quote_max_workers=4,
+        sink=JsonlSinkProps(
+            compression="gzip", compress_suffixes=["raw_objects", "raw_refs"]
+        ),
     )
     return TwitterQuoteHandler(props)
 
@@ -67,6 +88,19 @@ def get_birdwatch_raw_handler() -> BirdwatchRawHandler:
     return BirdwatchRawHandler(props)
 
 
+def get_birdwatch_parquet_batch() -> BirdwatchParquetBatch:
+    input_dir = os.path.join(str(os.environ.get("RAW_DATA_DIR")), "Birdwatch")
+    props = BirdwatchParquetBatchProps(input_dir=input_dir)
+    return BirdwatchParquetBatch(props)
+
+
+def get_birdwatch_delta_batch() -> BirdwatchDeltaBatch:
+    input_dir = os.path.join(str(os.environ.get("RAW_DATA_DIR")), "Birdwatch")
+    output_dir = os.path.join(str(os.environ.get("RAW_DATA_DIR")), "BirdwatchDelta")
+    props = BirdwatchDeltaBatchProps(input_dir=input_dir, output_dir=output_dir)
+    return BirdwatchDeltaBatch(props)
+
+
 def get_birdwatch_ref_batch() -> BirdwatchRefBatch:
     input_dir = os.path.join(str(os.environ.get("RAW_DATA_DIR")), "Birdwatch")
     output_dir = os.path.join(str(os.environ.get("RAW_DATA_DIR")), "BirdwatchRef")
@@ -88,28 +122,56 @@ if __name__ == "__main__":
     dotenv_path = join(dir_path, ".env")
     load_dotenv(dotenv_path, verbose=True)
 
+    # The YouTube API key travels in the query string, which urllib3 logs at
+    # DEBUG along with the rest of the request line
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(RedactFilter())
+
+    configure_http_client(
+        HttpClientProps(pool_connections=8, pool_maxsize=4, timeout=60.0)
+    )
+    start_metrics_server(MetricsServerProps())
+
+    # Jobs share one bounded pool, and a job whose previous run is still going
+    # is skipped rather than started again alongside it
+    scheduler = Scheduler(
+        SchedulerProps(
+            max_workers=4,
+            history_path=join(str(os.environ.get("RAW_DATA_DIR")), "runs.jsonl"),
+        )
+    )
+
     youtube_handler = get_youtube_handler()
-    schedule.every(4).hours.do(run_concurrently, youtube_handler.fetch)
+    schedule.every().hour.do(scheduler.submit, "youtube", youtube_handler.fetch)
 
     twitter_quote_handler = get_twitter_quote_handler()
-    schedule.every(3).hours.do(run_concurrently, twitter_quote_handler.fetch)
+    schedule.every(3).hours.do(
+        scheduler.submit, "twitter_quote", twitter_quote_handler.fetch
+    )
 
     birdwatch_raw_handler = get_birdwatch_raw_handler()
-    schedule.every(4).hours.do(run_concurrently, birdwatch_raw_handler.fetch)
+    schedule.every(4).hours.do(
+        scheduler.submit, "birdwatch_raw", birdwatch_raw_handler.fetch
+    )
 
-    birdwatch_ref_batch = get_birdwatch_ref_batch()
-    schedule.every().day.at("00:00").do(run_concurrently, birdwatch_ref_batch.run)
+    birdwatch_parquet_batch = get_birdwatch_parquet_batch()
+    schedule.every(4).hours.do(
+        scheduler.submit, "birdwatch_parquet", birdwatch_parquet_batch.run
+    )
 
-    threads = []
-    threads.append(threading.Thread(target=youtube_handler.fetch))
-    threads.append(threading.Thread(target=twitter_quote_handler.fetch))
-    threads.append(threading.Thread(target=birdwatch_raw_handler.fetch))
+    birdwatch_delta_batch = get_birdwatch_delta_batch()
+    schedule.every(4).hours.do(
+        scheduler.submit, "birdwatch_delta", birdwatch_delta_batch.run
+    )
 
-    for thread in threads:
-        thread.start()
+    birdwatch_ref_batch = get_birdwatch_ref_batch()
+    schedule.every().day.at("00:00").do(
+        scheduler.submit, "birdwatch_ref", birdwatch_ref_batch.run
+    )
 
-    for thread in threads:
-        thread.join()
+    scheduler.submit("youtube", youtube_handler.fetch)
+    scheduler.submit("twitter_quote", twitter_quote_handler.fetch)
+    scheduler.submit("birdwatch_raw", birdwatch_raw_handler.fetch)
 
     while True:
         schedule.run_pending()
@@ -0,0 +1,167 @@
+import argparse
+import bisect
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from logging import getLogger
+
+from handler.twitter_quote import TWEET_EXTRACTOR, quoted_status_id, timeline_entries
+from handler.youtube import build_video, extract_comment
+from util.raw_store import iter_raw_with_timestamp
+from util.serializer import dumps_line
+
+logger = getLogger(__name__)
+
+RAW_FILENAME = re.compile(r"^(\d{4}-\d{2}-\d{2})_(\w+_)?raw(_refs)?\.jsonl")
+
+
+def replay_twitter(input_dir: str, dates: list[str]):
+    # Dates are replayed in order with what the live run knew carried across:
+    # a tweet emitted once is skipped after, as the fetched store skips it,
+    # and quote searches that cross midnight land in the next day's archive
+    seen = set()
+    quote_ids = set()
+    held_date = None
+    held = {}
+    for target_date in dates:
+        records = {}
+        for timestamp, res in iter_raw_with_timestamp(input_dir, target_date, "raw"):
+            for entry in timeline_entries(res):
+                tweet = TWEET_EXTRACTOR.extract(entry)
+                if tweet is None:
+                    continue
+                id_str = tweet["tweet"]["id_str"]
+                # Quote searches and timeline searches share one raw stream; a
+                # tweet is a quote when the tweet it quotes was just fetched,
+                # since its quote search follows right after in the archive
+                quoted_id = quoted_status_id(entry)
+                if quoted_id in held:
+                    # The parent is written once its last quote page is in
+                    records[quoted_id] = held.pop(quoted_id)
+                if quoted_id in records:
+                    if id_str not in quote_ids:
+                        quote_ids.add(id_str)
+                        del tweet["tweet"]["expanded_url"]
+                        tweet["timestamp"] = timestamp
+                        records[quoted_id]["quotes"].append(tweet)
+                    continue
+                if id_str in seen:
+                    continue
+                seen.add(id_str)
+                # Fetch time of the response stands in for the original
+                # record timestamp
+                tweet["quotes"] = []
+                tweet["headline"] = {}
+                tweet["timestamp"] = timestamp
+                records[id_str] = tweet
+        if held_date is not None:
+            yield held_date, list(held.values())
+        held_date, held = target_date, records
+    if held_date is not None:
+        yield held_date, list(held.values())
+    malformed = TWEET_EXTRACTOR.take_malformed()
+    if malformed > 0:
+        logger.warning("Skipped %d malformed timeline entries", malformed)
+
+
+def replay_youtube(input_dir: str, target_date: str) -> list[dict]:
+    details = {}
+    for timestamp, res in iter_raw_with_timestamp(input_dir, target_date, "detail_raw"):
+        for item in res.get("items", []):
+            details[item["id"]] = (timestamp, item)
+    comments = {}
+    comment_ids = set()
+    for _, res in iter_raw_with_timestamp(input_dir, target_date, "comment_raw"):
+        for item in res.get("items", []):
+            try:
+                comment = extract_comment(item)
+            except Exception as ex:
+                logger.error(ex)
+                continue
+            if comment["comment_id"] in comment_ids:
+                continue
+            comment_ids.add(comment["comment_id"])
+            comments.setdefault(item["snippet"]["videoId"], []).append(comment)
+    records = []
+    for video_id, (timestamp, item) in details.items():
+        try:
+            video = build_video(item, comments.get(video_id, []))
+            video["timestamp"] = timestamp
+            records.append(video)
+        except Exception as ex:
+            logger.error(ex)
+    return records
+
+
+SOURCES = ["twitter", "youtube"]
+
+
+def write_records(output_dir: str, target_date: str, records: list[dict]) -> int:
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, f"{target_date}.jsonl")
+    with open(output_path + ".tmp", "wb") as f:
+        for record in records:
+            f.write(dumps_line(record))
+    os.replace(output_path + ".tmp", output_path)
+    return len(records)
+
+
+def replay_youtube_date(input_dir: str, output_dir: str, target_date: str) -> int:
+    return write_records(
+        output_dir, target_date, replay_youtube(input_dir, target_date)
+    )
+
+
+def find_dates(input_dir: str) -> list[str]:
+    dates = set()
+    for filename in os.listdir(input_dir):
+        match = RAW_FILENAME.match(filename)
+        if match is not None:
+            dates.add(match.group(1))
+    return sorted(dates)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(name)s:%(lineno)s %(funcName)s [%(levelname)s]: %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Rebuild normalized output from raw archives without network"
+    )
+    parser.add_argument("source", choices=SOURCES)
+    parser.add_argument("input_dir", help="handler directory holding *_raw archives")
+    parser.add_argument("output_dir")
+    parser.add_argument("--date", action="append", dest="dates")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    dates = args.dates if args.dates is not None else find_dates(args.input_dir)
+    if args.source == "twitter":
+        # Each date depends on the ones before it, so every archive up to the
+        # day after the last one asked for is replayed in a single pass
+        archived = find_dates(args.input_dir)
+        last = bisect.bisect_right(archived, max(dates, default=""))
+        for target_date, records in replay_twitter(
+            args.input_dir, archived[: last + 1]
+        ):
+            if target_date in dates:
+                count = write_records(args.output_dir, target_date, records)
+                logger.info("Replayed %s: %d records", target_date, count)
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = {
+                executor.submit(
+                    replay_youtube_date, args.input_dir, args.output_dir, target_date
+                ): target_date
+                for target_date in dates
+            }
+            for future in as_completed(futures):
+                try:
+                    logger.info(
+                        "Replayed %s: %d records", futures[future], future.result()
+                    )
+                except Exception as ex:
+                    logger.error(ex)
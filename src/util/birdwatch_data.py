@@ -0,0 +1,143 @@
+import json
+import os
+from glob import glob
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+INT64_COLUMNS = {
+    "noteId",
+    "tweetId",
+    "createdAtMillis",
+    "ratedOnTweetId",
+    "version",
+    "timestampMillisOfFirstNonNMRStatus",
+    "timestampMillisOfCurrentStatus",
+    "timestampMillisOfLatestNonNMRStatus",
+    "timestampMillisOfStatusLock",
+    "timestampMillisOfRetroLock",
+    "timestampMillisOfNmrDueToMinStableCrhTime",
+    "timestampOfLastStateChange",
+    "timestampOfLastEarnOut",
+    "successfulRatingNeededToEarnIn",
+}
+CATEGORY_COLUMNS = {
+    "classification",
+    "believable",
+    "harmful",
+    "validationDifficulty",
+    "helpfulnessLevel",
+    "firstNonNMRStatus",
+    "currentStatus",
+    "mostRecentNonNMRStatus",
+    "lockedStatus",
+    "currentCoreStatus",
+    "currentExpansionStatus",
+    "currentGroupStatus",
+    "currentDecidedBy",
+    "currentMultiGroupStatus",
+    "enrollmentState",
+    "modelingPopulation",
+}
+SHARDS_METADATA_KEY = b"birdwatch_shards"
+FLAG_COLUMN_PREFIXES = ("misleading", "notMisleading", "helpful", "notHelpful")
+FLAG_COLUMNS = {
+    "trustworthySources",
+    "isMediaNote",
+    "isCollaborativeNote",
+    "agree",
+    "disagree",
+}
+
+
+def column_dtype(column: str) -> str:
+    if column in ("noteId", "tweetId"):
+        return "int64"
+    if column in INT64_COLUMNS:
+        return "Int64"
+    if column in CATEGORY_COLUMNS:
+        return "category"
+    if column in FLAG_COLUMNS or column.startswith(FLAG_COLUMN_PREFIXES):
+        return "Int8"
+    return "string"
+
+
+def shard_paths(date_dir: str, value: str) -> list[str]:
+    return sorted(glob(os.path.join(date_dir, f"{value}-*.tsv")))
+
+
+def parquet_path(date_dir: str, value: str) -> str:
+    return os.path.join(date_dir, f"{value}.parquet")
+
+
+def is_gzip(path: str) -> bool:
+    with open(path, "rb") as file:
+        return file.read(2) == b"\x1f\x8b"
+
+
+def read_header(path: str) -> list[str]:
+    return pd.read_csv(
+        path,
+        delimiter="\t",
+        nrows=0,
+        compression="gzip" if is_gzip(path) else None,
+    ).columns.tolist()
+
+
+def read_tsv(path: str, columns: list[str] | None = None, **kwargs):
+    header = read_header(path)
+    if columns is not None:
+        header = [column for column in header if column in columns]
+    return pd.read_csv(
+        path,
+        delimiter="\t",
+        usecols=header,
+        dtype={column: column_dtype(column) for column in header},
+        compression="gzip" if is_gzip(path) else None,
+        **kwargs,
+    )
+
+
+def shard_signature(paths: list[str]) -> list[list]:
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+    return signature
+
+
+def has_parquet(date_dir: str, value: str) -> bool:
+    path = parquet_path(date_dir, value)
+    if not os.path.exists(path):
+        return False
+    # The file records the shards it was converted from. Mtimes alone are not
+    # enough: a shard landing mid-conversion keeps its download-time mtime,
+    # which can predate the parquet file
+    metadata = pq.read_schema(path).metadata or {}
+    # Files written without pandas metadata read nullable ints back as floats
+    if SHARDS_METADATA_KEY not in metadata or b"pandas" not in metadata:
+        return False
+    return json.loads(metadata[SHARDS_METADATA_KEY]) == shard_signature(
+        shard_paths(date_dir, value)
+    )
+
+
+def read_columns(date_dir: str, value: str, columns: list[str] | None = None):
+    if has_parquet(date_dir, value):
+        return pd.read_parquet(parquet_path(date_dir, value), columns=columns)
+    data_list = [read_tsv(path, columns) for path in shard_paths(date_dir, value)]
+    if len(data_list) == 0:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(data_list, ignore_index=True)
+
+
+def iter_columns(date_dir: str, value: str, columns: list[str] | None, chunksize: int):
+    if has_parquet(date_dir, value):
+        parquet_file = pq.ParquetFile(parquet_path(date_dir, value))
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+    for path in shard_paths(date_dir, value):
+        with read_tsv(path, columns, chunksize=chunksize) as reader:
+            for chunk in reader:
+                yield chunk
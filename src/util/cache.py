@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from logging import getLogger
+from pathlib import Path
+
+from util.serializer import dumps, loads
+
+
+class CacheProps:
+    def __init__(
+        self,
+        ttl: float = 6 * 3600.0,
+        negative_ttl: float = 3600.0,
+        max_entries: int = 1024,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+
+    def to_dict(self):
+        return {
+            "ttl": self.ttl,
+            "negative_ttl": self.negative_ttl,
+            "max_entries": self.max_entries,
+        }
+
+    @staticmethod
+    def from_dict(props: dict):
+        return CacheProps(
+            ttl=props["ttl"],
+            negative_ttl=props["negative_ttl"],
+            max_entries=props["max_entries"],
+        )
+
+
+class DiskCache:
+    def __init__(self, path: str, props: CacheProps):
+        self.path = path
+        self.props = props
+        self.logger = getLogger(__name__)
+        self.__lock = threading.Lock()
+        self.__entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self.__db: sqlite3.Connection | None = None
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__db is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self.__db = sqlite3.connect(self.path, check_same_thread=False)
+            self.__db.execute(
+                "CREATE TABLE IF NOT EXISTS cache"
+                " (key TEXT PRIMARY KEY, expires_at REAL, value BLOB)"
+            )
+            self.__db.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+            self.__db.commit()
+        return self.__db
+
+    def get(self, key: str) -> tuple[bool, object]:
+        # A hit may carry None: a negative entry for a key known to fail
+        now = time.time()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                row = (
+                    self.__connect()
+                    .execute(
+                        "SELECT expires_at, value FROM cache WHERE key = ?", (key,)
+                    )
+                    .fetchone()
+                )
+                if row is None:
+                    return False, None
+                entry = (row[0], loads(row[1]))
+                self.__remember(key, entry)
+            else:
+                self.__entries.move_to_end(key)
+            if entry[0] < now:
+                del self.__entries[key]
+                return False, None
+            return True, entry[1]
+
+    def put(self, key: str, value):
+        ttl = self.props.ttl if value is not None else self.props.negative_ttl
+        entry = (time.time() + ttl, value)
+        with self.__lock:
+            self.__remember(key, entry)
+            db = self.__connect()
+            db.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+                (key, entry[0], dumps(value)),
+            )
+            db.commit()
+
+    def __remember(self, key: str, entry: tuple[float, object]):
+        self.__entries[key] = entry
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.props.max_entries:
+            self.__entries.popitem(last=False)
+
+    def close(self):
+        with self.__lock:
+            if self.__db is not None:
+                self.__db.close()
+                self.__db = None
+
+
+_caches: dict[str, DiskCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(path: str, props: CacheProps) -> DiskCache:
+    key = os.path.abspath(path)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = DiskCache(key, props)
+        return _caches[key]
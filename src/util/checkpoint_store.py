@@ -0,0 +1,60 @@
+import json
+import os
+import threading
+from logging import getLogger
+from pathlib import Path
+
+_stores: dict[str, "CheckpointStore"] = {}
+_stores_lock = threading.Lock()
+
+
+def get_checkpoint_store(path: str) -> "CheckpointStore":
+    key = os.path.abspath(path)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = CheckpointStore(key)
+        return _stores[key]
+
+
+class CheckpointStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.logger = getLogger(__name__)
+        self.__lock = threading.Lock()
+        self.__checkpoints: dict[str, dict] | None = None
+
+    def __load(self):
+        if self.__checkpoints is not None:
+            return
+        checkpoints = {}
+        if Path(self.path).exists():
+            with open(self.path, "r") as f:
+                checkpoints = json.load(f)
+            self.logger.info("Loaded %d checkpoints: %s", len(checkpoints), self.path)
+        self.__checkpoints = checkpoints
+
+    def get(self, key: str) -> dict | None:
+        with self.__lock:
+            self.__load()
+            return self.__checkpoints.get(key)
+
+    def save(self, key: str, checkpoint: dict):
+        with self.__lock:
+            self.__load()
+            self.__checkpoints[key] = checkpoint
+            self.__write()
+
+    def clear(self, key: str):
+        with self.__lock:
+            self.__load()
+            if self.__checkpoints.pop(key, None) is not None:
+                self.__write()
+
+    def __write(self):
+        # Written whole and renamed so a crash mid-write keeps the last
+        # complete set of checkpoints
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.__checkpoints, f)
+        os.replace(tmp_path, self.path)
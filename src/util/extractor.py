@@ -0,0 +1,108 @@
+import threading
+
+MISSING = object()
+
+
+class Field:
+    def __init__(self, path: str, default=MISSING):
+        self.path = path
+        self.default = default
+
+
+def parse_path(path: str) -> tuple:
+    if path == "":
+        return ()
+    return tuple(int(key) if key.isdigit() else key for key in path.split("."))
+
+
+def compile_schema(schema: dict, root: str = "", on_malformed=None):
+    # Generates one function that walks each shared path prefix once; the
+    # try blocks cost nothing unless a path is actually missing
+    root_path = parse_path(root)
+    namespace = {"on_malformed": on_malformed}
+    variables = {(): "data"}
+    fields = []
+
+    def lookup(path: tuple, lines: list, name: str | None = None) -> str:
+        if path not in variables:
+            parent = lookup(path[:-1], lines)
+            variables[path] = name if name is not None else f"v{len(variables)}"
+            lines.append(f"{variables[path]} = {parent}[{path[-1]!r}]")
+        return variables[path]
+
+    def build(node: dict) -> str:
+        items = []
+        for key, value in node.items():
+            if isinstance(value, dict):
+                items.append(f"{key!r}: {build(value)}")
+                continue
+            field = value if isinstance(value, Field) else Field(value)
+            fields.append(
+                (f"f{len(fields)}", root_path + parse_path(field.path), field)
+            )
+            items.append(f"{key!r}: {fields[-1][0]}")
+        return "{" + ", ".join(items) + "}"
+
+    body = build(schema)
+    lines = ["def extract(data):"]
+    if len(root_path) > 0:
+        root_lines = []
+        lookup(root_path, root_lines)
+        lines.append("    try:")
+        lines.extend(f"        {line}" for line in root_lines)
+        lines.append("    except (LookupError, TypeError):")
+        lines.append("        return None")
+    required_lines = []
+    for name, path, field in fields:
+        if field.default is MISSING:
+            variable = lookup(path, required_lines, name)
+            if variable != name:
+                required_lines.append(f"{name} = {variable}")
+    if len(required_lines) > 0:
+        lines.append("    try:")
+        lines.extend(f"        {line}" for line in required_lines)
+        lines.append("    except (LookupError, TypeError):")
+        if on_malformed is not None:
+            lines.append("        on_malformed()")
+        lines.append("        return None")
+    for name, path, field in fields:
+        if field.default is MISSING:
+            continue
+        # Optional paths start from the deepest prefix the required fields
+        # already resolved and never extend the shared walk
+        depth = max(i for i in range(len(path)) if path[:i] in variables)
+        chain = "".join(f"[{key!r}]" for key in path[depth:])
+        namespace[f"d{name}"] = field.default
+        lines.append("    try:")
+        lines.append(f"        {name} = {variables[path[:depth]]}{chain}")
+        lines.append("    except (LookupError, TypeError):")
+        lines.append(f"        {name} = d{name}")
+    lines.append(f"    return {body}")
+    exec("\n".join(lines), namespace)
+    return namespace["extract"]
+
+
+def compile_path(path: str, default=None):
+    extract = compile_schema({"value": Field(path, default)})
+    return lambda data: extract(data)["value"]
+
+
+class Extractor:
+    def __init__(self, schema: dict, root: str = ""):
+        self.schema = schema
+        self.root = root
+        self.__lock = threading.Lock()
+        self.__malformed = 0
+        # Entries outside root yield None silently; entries under root that
+        # miss a required field yield None and are counted as malformed
+        self.extract = compile_schema(schema, root, self.__count_malformed)
+
+    def take_malformed(self) -> int:
+        with self.__lock:
+            malformed = self.__malformed
+            self.__malformed = 0
+        return malformed
+
+    def __count_malformed(self):
+        with self.__lock:
+            self.__malformed += 1
@@ -0,0 +1,90 @@
+import os
+import threading
+from logging import getLogger
+from pathlib import Path
+
+_stores: dict[str, "FetchedStore"] = {}
+_stores_lock = threading.Lock()
+
+
+def get_fetched_store(path: str) -> "FetchedStore":
+    key = os.path.abspath(path)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = FetchedStore(key)
+        return _stores[key]
+
+
+class FetchedStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.logger = getLogger(__name__)
+        self.__lock = threading.Lock()
+        self.__ids: set[str] | None = None
+        self.__file = None
+
+    def __load(self):
+        if self.__ids is not None:
+            return
+        ids = set()
+        if Path(self.path).exists():
+            with open(self.path, "r") as f:
+                for line in f:
+                    line = line.rstrip("\n")
+                    if line != "":
+                        ids.add(line)
+        else:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.__ids = ids
+        self.__file = open(self.path, "a")
+        self.logger.info("Loaded %d fetched ids: %s", len(ids), self.path)
+
+    def __len__(self):
+        with self.__lock:
+            self.__load()
+            return len(self.__ids)
+
+    def __contains__(self, id_str: str):
+        return self.contains(id_str)
+
+    def contains(self, id_str: str) -> bool:
+        with self.__lock:
+            self.__load()
+            return str(id_str) in self.__ids
+
+    def ids(self) -> frozenset[str]:
+        with self.__lock:
+            self.__load()
+            return frozenset(self.__ids)
+
+    def add(self, id_str: str) -> bool:
+        id_str = str(id_str)
+        with self.__lock:
+            self.__load()
+            if id_str in self.__ids:
+                return False
+            self.__ids.add(id_str)
+            self.__file.write(id_str + "\n")
+            self.__file.flush()
+            return True
+
+    def add_many(self, id_strs) -> list[str]:
+        added = []
+        with self.__lock:
+            self.__load()
+            for id_str in map(str, id_strs):
+                if id_str in self.__ids:
+                    continue
+                self.__ids.add(id_str)
+                added.append(id_str)
+            if len(added) > 0:
+                self.__file.write("".join(id_str + "\n" for id_str in added))
+                self.__file.flush()
+        return added
+
+    def close(self):
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+            self.__ids = None
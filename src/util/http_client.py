@@ -0,0 +1,295 @@
+import json
+import os
+import random
+import threading
+import time
+from email.utils import formatdate
+from logging import getLogger
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from util.metrics import get_metrics
+from util.rate_limiter import RateLimiter
+from util.redact import redact
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def endpoint_name(url: str, limiter: RateLimiter | None = None) -> str:
+    # Limiter names already group requests by API endpoint; anything else is
+    # labelled by host to keep per-page URLs out of the label set
+    if limiter is not None:
+        return limiter.props.name
+    return urlsplit(url).netloc
+
+
+class HttpClientProps:
+    def __init__(
+        self,
+        pool_connections: int = 8,
+        pool_maxsize: int = 4,
+        timeout: float = 60.0,
+        max_retries: int = 3,
+        backoff_base: float = 2.0,
+        backoff_max: float = 120.0,
+        host_overrides: dict[str, str] | None = None,
+    ):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.host_overrides = host_overrides
+
+    def to_dict(self):
+        return {
+            "pool_connections": self.pool_connections,
+            "pool_maxsize": self.pool_maxsize,
+            "timeout": self.timeout,
+            "max_retries": self.max_retries,
+            "backoff_base": self.backoff_base,
+            "backoff_max": self.backoff_max,
+            "host_overrides": self.host_overrides,
+        }
+
+    @staticmethod
+    def from_dict(props: dict):
+        return HttpClientProps(
+            pool_connections=props["pool_connections"],
+            pool_maxsize=props["pool_maxsize"],
+            timeout=props["timeout"],
+            max_retries=props.get("max_retries", 3),
+            backoff_base=props.get("backoff_base", 2.0),
+            backoff_max=props.get("backoff_max", 120.0),
+            host_overrides=props.get("host_overrides"),
+        )
+
+
+class HttpClient:
+    def __init__(self, props: HttpClientProps):
+        self.props = props
+        self.logger = getLogger(__name__)
+        self.session = requests.Session()
+        # pool_block caps the open connections per host at pool_maxsize
+        adapter = HTTPAdapter(
+            pool_connections=props.pool_connections,
+            pool_maxsize=props.pool_maxsize,
+            pool_block=True,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Origins such as "https://www.googleapis.com" can be pointed at a
+        # local stand-in; metrics keep the original host as their label
+        self.__overrides = props.host_overrides or {}
+        self.__overridden_hosts = {
+            urlsplit(target).netloc: urlsplit(origin).netloc
+            for origin, target in self.__overrides.items()
+        }
+
+    def __resolve(self, url: str) -> str:
+        for origin, target in self.__overrides.items():
+            if url.startswith(origin):
+                return target + url[len(origin) :]
+        return url
+
+    def request(
+        self, method: str, url: str, limiter: RateLimiter | None = None, **kwargs
+    ) -> requests.Response:
+        kwargs.setdefault("timeout", self.props.timeout)
+        endpoint = endpoint_name(url, limiter)
+        attempt = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire()
+            started_at = time.perf_counter()
+            try:
+                content = self.session.request(method, self.__resolve(url), **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                self.__observe(endpoint, "error", started_at)
+                if attempt >= self.props.max_retries:
+                    raise
+                self.logger.warning(redact(str(ex)))
+            else:
+                # Streamed bodies are counted as they are read, in iter_content
+                if not kwargs.get("stream"):
+                    self.__count_bytes(endpoint, len(content.content))
+                self.__observe(endpoint, content.status_code, started_at)
+                if limiter is not None:
+                    limiter.update(content.headers)
+                if content.status_code != 429 and content.status_code < 500:
+                    return content
+                if attempt >= self.props.max_retries:
+                    return content
+                self.logger.warning(
+                    "Retrying %s: HTTP %d", url.split("?")[0], content.status_code
+                )
+                # Streamed responses hold their pooled connection until closed
+                content.close()
+            self.__sleep_backoff(endpoint, attempt)
+            attempt += 1
+
+    def iter_content(self, content: requests.Response, chunk_size: int):
+        endpoint = endpoint_name(content.url)
+        endpoint = self.__overridden_hosts.get(endpoint, endpoint)
+        for chunk in content.iter_content(chunk_size):
+            self.__count_bytes(endpoint, len(chunk))
+            yield chunk
+
+    def __observe(self, endpoint: str, status, started_at: float):
+        metrics = get_metrics()
+        metrics.histogram(
+            "http_request_seconds",
+            "Time to response headers per attempt",
+            endpoint=endpoint,
+        ).observe(time.perf_counter() - started_at)
+        metrics.counter(
+            "http_requests_total",
+            "Request attempts by response status",
+            endpoint=endpoint,
+            status=status,
+        ).inc()
+
+    def __count_bytes(self, endpoint: str, size: int):
+        get_metrics().counter(
+            "http_response_bytes_total", "Response body bytes read", endpoint=endpoint
+        ).inc(size)
+
+    def __sleep_backoff(self, endpoint: str, attempt: int):
+        wait = self.__backoff(attempt)
+        get_metrics().counter(
+            "http_retry_wait_seconds_total",
+            "Time slept between retries",
+            endpoint=endpoint,
+        ).inc(wait)
+        time.sleep(wait)
+
+    def __backoff(self, attempt: int) -> float:
+        # Full jitter keeps concurrent workers from retrying in lockstep
+        return random.uniform(
+            0, min(self.props.backoff_max, self.props.backoff_base * 2**attempt)
+        )
+
+    def download(self, url: str, path: str) -> bool:
+        part_path = path + ".part"
+        meta_path = path + ".meta.json"
+        endpoint = endpoint_name(url)
+        attempt = 0
+        while True:
+            try:
+                return self.__download(url, path, part_path, meta_path, endpoint)
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                if attempt >= self.props.max_retries:
+                    raise
+                self.logger.warning(redact(str(ex)))
+            except requests.HTTPError as ex:
+                status_code = ex.response.status_code
+                if status_code != 429 and status_code < 500:
+                    raise
+                if attempt >= self.props.max_retries:
+                    raise
+                self.logger.warning("Retrying %s: HTTP %d", url, status_code)
+            self.__sleep_backoff(endpoint, attempt)
+            attempt += 1
+
+    def __download(
+        self, url: str, path: str, part_path: str, meta_path: str, endpoint: str
+    ):
+        # The part file carries its own validator and it only replaces the
+        # shard's once the body is complete, so a crash mid-download never
+        # pairs the old shard with the new version's ETag
+        part_meta_path = part_path + ".meta.json"
+        meta = self.__read_meta(meta_path)
+        part_meta = self.__read_meta(part_meta_path)
+        headers = {}
+        validator = part_meta.get("etag") or part_meta.get("last_modified")
+        if os.path.exists(part_path) and validator is not None:
+            headers["Range"] = f"bytes={os.path.getsize(part_path)}-"
+            headers["If-Range"] = validator
+        elif os.path.exists(path):
+            if "etag" in meta:
+                headers["If-None-Match"] = meta["etag"]
+            if "last_modified" in meta:
+                headers["If-Modified-Since"] = meta["last_modified"]
+            else:
+                headers["If-Modified-Since"] = formatdate(
+                    os.path.getmtime(path), usegmt=True
+                )
+        started_at = time.perf_counter()
+        try:
+            content = self.session.get(
+                self.__resolve(url),
+                headers=headers,
+                stream=True,
+                timeout=self.props.timeout,
+            )
+        except (requests.ConnectionError, requests.Timeout):
+            self.__observe(endpoint, "error", started_at)
+            raise
+        self.__observe(endpoint, content.status_code, started_at)
+        with content:
+            if content.status_code == 304:
+                return False
+            if content.status_code == 416 and "Range" in headers:
+                # The part file already holds the whole body
+                self.__complete(path, part_path, meta_path, part_meta_path)
+                return True
+            content.raise_for_status()
+            if content.status_code != 206:
+                part_meta = {}
+                if "ETag" in content.headers:
+                    part_meta["etag"] = content.headers["ETag"]
+                if "Last-Modified" in content.headers:
+                    part_meta["last_modified"] = content.headers["Last-Modified"]
+                self.__write_meta(part_meta_path, part_meta)
+            mode = "ab" if content.status_code == 206 else "wb"
+            with open(part_path, mode) as f:
+                for chunk in self.iter_content(content, CHUNK_SIZE):
+                    f.write(chunk)
+            self.__complete(path, part_path, meta_path, part_meta_path)
+            return True
+
+    def __complete(
+        self, path: str, part_path: str, meta_path: str, part_meta_path: str
+    ):
+        os.replace(part_path, path)
+        if os.path.exists(part_meta_path):
+            os.replace(part_meta_path, meta_path)
+
+    def __read_meta(self, meta_path: str) -> dict:
+        if not os.path.exists(meta_path):
+            return {}
+        with open(meta_path, "r") as f:
+            return json.load(f)
+
+    def __write_meta(self, meta_path: str, meta: dict):
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def close(self):
+        self.session.close()
+
+
+_client: HttpClient | None = None
+_client_lock = threading.Lock()
+
+
+def configure_http_client(props: HttpClientProps) -> HttpClient:
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = HttpClient(props)
+        return _client
+
+
+def get_http_client() -> HttpClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(HttpClientProps())
+        return _client
@@ -0,0 +1,106 @@
+import time
+from logging import getLogger
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+HIRAGANA_RANGES = [(0x3041, 0x309F)]
+KATAKANA_RANGES = [(0x30A0, 0x30FF), (0xFF66, 0xFF9D)]
+KANJI_RANGES = [(0x3400, 0x4DBF), (0x4E00, 0x9FFF)]
+
+
+class LanguageFilterProps:
+    def __init__(self, min_kana_count: int = 1, min_japanese_ratio: float = 0.0):
+        self.min_kana_count = min_kana_count
+        self.min_japanese_ratio = min_japanese_ratio
+
+    def to_dict(self):
+        return {
+            "min_kana_count": self.min_kana_count,
+            "min_japanese_ratio": self.min_japanese_ratio,
+        }
+
+    @staticmethod
+    def from_dict(props: dict):
+        return LanguageFilterProps(
+            min_kana_count=props["min_kana_count"],
+            min_japanese_ratio=props["min_japanese_ratio"],
+        )
+
+
+class LanguageFilter:
+    def __init__(self, props: LanguageFilterProps | None = None):
+        self.props = props if props is not None else LanguageFilterProps()
+        self.logger = getLogger(__name__)
+
+    def classify(self, texts: pd.Series) -> pd.DataFrame:
+        started_at = time.perf_counter()
+        array = pa.array(texts, type=pa.large_string(), from_pandas=True)
+        if isinstance(array, pa.ChunkedArray):
+            # pyarrow-backed columns come back chunked after concat or a
+            # Parquet read; the scan below needs one contiguous buffer
+            array = array.combine_chunks()
+        # Scan the UTF-8 buffer directly: every script counted here is a
+        # three-byte sequence, so decode code points only at 0xE0-0xEF leads
+        offsets = np.frombuffer(array.buffers()[1], dtype=np.int64)[
+            array.offset : array.offset + len(array) + 1
+        ]
+        data_buffer = array.buffers()[2]
+        if data_buffer is None or len(array) == 0:
+            data = np.empty(0, dtype=np.uint8)
+        else:
+            data = np.frombuffer(data_buffer, dtype=np.uint8)[: offsets[-1]]
+        start = offsets[0] if len(offsets) > 0 else 0
+        leads = start + np.flatnonzero(
+            (data[start : max(len(data) - 2, start)] & 0xF0) == 0xE0
+        )
+        code_points = (
+            ((data[leads].astype(np.int32) & 0x0F) << 12)
+            | ((data[leads + 1].astype(np.int32) & 0x3F) << 6)
+            | (data[leads + 2].astype(np.int32) & 0x3F)
+        )
+        scripts = np.zeros(len(code_points), dtype=np.int64)
+        for script, ranges in enumerate(
+            [HIRAGANA_RANGES, KATAKANA_RANGES, KANJI_RANGES], start=1
+        ):
+            for range_start, range_end in ranges:
+                in_range = (code_points >= range_start) & (code_points <= range_end)
+                scripts[in_range] = script
+        matched = scripts > 0
+        rows = np.searchsorted(offsets, leads[matched], side="right") - 1
+        script_counts = np.bincount(
+            rows * 3 + scripts[matched] - 1, minlength=len(array) * 3
+        ).reshape(len(array), 3)
+
+        counts = pd.DataFrame(
+            {
+                "hiragana": script_counts[:, 0],
+                "katakana": script_counts[:, 1],
+                "kanji": script_counts[:, 2],
+                "chars": pc.utf8_length(array).fill_null(0).to_numpy(),
+            },
+            index=texts.index,
+        )
+        elapsed = time.perf_counter() - started_at
+        self.logger.debug(
+            "Classified %d rows (%.1f MB) in %.3fs: %.0f rows/s",
+            len(array),
+            len(data) / 1_000_000,
+            elapsed,
+            len(array) / elapsed if elapsed > 0 else 0,
+        )
+        return counts
+
+    def mask(self, texts: pd.Series) -> pd.Series:
+        counts = self.classify(texts)
+        kana = counts["hiragana"] + counts["katakana"]
+        japanese = kana + counts["kanji"]
+        ratio = japanese / counts["chars"].where(counts["chars"] > 0, 1)
+        return (kana >= self.props.min_kana_count) & (
+            ratio >= self.props.min_japanese_ratio
+        )
+
+    def is_japanese(self, text: str | None) -> bool:
+        return bool(self.mask(pd.Series([text]))[0])
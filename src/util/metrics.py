@@ -0,0 +1,208 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+class MetricsServerProps:
+    def __init__(self, host: str = "127.0.0.1", port: int = 9108):
+        self.host = host
+        self.port = port
+
+    def to_dict(self):
+        return {
+            "host": self.host,
+            "port": self.port,
+        }
+
+    @staticmethod
+    def from_dict(props: dict):
+        return MetricsServerProps(
+            host=props.get("host", "127.0.0.1"),
+            port=props.get("port", 9108),
+        )
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__value = 0.0
+
+    def inc(self, value: float = 1.0):
+        with self.__lock:
+            self.__value += value
+
+    def get(self) -> float:
+        with self.__lock:
+            return self.__value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.__lock = threading.Lock()
+        # The last slot counts observations above the largest bucket
+        self.__counts = [0] * (len(buckets) + 1)
+        self.__sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.__lock:
+            self.__counts[index] += 1
+            self.__sum += value
+
+    def get(self) -> tuple[list[int], float]:
+        with self.__lock:
+            return list(self.__counts), self.__sum
+
+    @contextmanager
+    def time(self):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def series_name(name: str, labels: tuple[tuple[str, str], ...]) -> str:
+    if len(labels) == 0:
+        return name
+    values = ",".join(f'{key}="{escape_label(value)}"' for key, value in labels)
+    return f"{name}{{{values}}}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__help: dict[str, tuple[str, str]] = {}
+        self.__metrics: dict[tuple[str, tuple], Counter | Histogram] = {}
+
+    def counter(self, name: str, help: str, **labels: str) -> Counter:
+        return self.__get(name, help, labels, Counter)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+        **labels: str,
+    ) -> Histogram:
+        return self.__get(name, help, labels, lambda: Histogram(buckets))
+
+    def __get(self, name: str, help: str, labels: dict, factory):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self.__lock:
+            metric = self.__metrics.get(key)
+            if metric is None:
+                metric = factory()
+                self.__metrics[key] = metric
+                self.__help.setdefault(name, (metric.kind, help))
+            return metric
+
+    def __items(self):
+        with self.__lock:
+            return sorted(self.__metrics.items()), dict(self.__help)
+
+    def snapshot(self) -> dict[str, float]:
+        # Histograms are reduced to their count and sum, which is what a run
+        # summary needs; the endpoint serves the full buckets
+        values = {}
+        items, _ = self.__items()
+        for (name, labels), metric in items:
+            if isinstance(metric, Counter):
+                values[series_name(name, labels)] = metric.get()
+            else:
+                counts, total = metric.get()
+                values[series_name(name + "_count", labels)] = sum(counts)
+                values[series_name(name + "_sum", labels)] = total
+        return values
+
+    def render(self) -> str:
+        lines = []
+        items, help = self.__items()
+        described = set()
+        for (name, labels), metric in items:
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {help[name][1]}")
+                lines.append(f"# TYPE {name} {help[name][0]}")
+            if isinstance(metric, Counter):
+                lines.append(f"{series_name(name, labels)} {metric.get()}")
+                continue
+            counts, total = metric.get()
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(
+                    f"{series_name(name + '_bucket', labels + (('le', le),))} {cumulative}"
+                )
+            lines.append(f"{series_name(name + '_count', labels)} {cumulative}")
+            lines.append(f"{series_name(name + '_sum', labels)} {total}")
+        return "\n".join(lines) + "\n"
+
+
+def summarize(before: dict[str, float], after: dict[str, float]) -> dict[str, float]:
+    return {
+        key: round(value - before.get(key, 0.0), 3)
+        for key, value in after.items()
+        if value != before.get(key, 0.0)
+    }
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    return _registry
+
+
+def start_metrics_server(props: MetricsServerProps) -> ThreadingHTTPServer:
+    logger = getLogger(__name__)
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = _registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((props.host, props.port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Serving metrics: http://%s:%d/metrics", props.host, props.port)
+    return server
@@ -0,0 +1,79 @@
+import heapq
+import math
+import threading
+from logging import getLogger
+
+
+class QuotaProps:
+    def __init__(
+        self,
+        daily_units: int = 10_000,
+        runs_per_day: int = 1,
+        search_share: float = 0.5,
+    ):
+        self.daily_units = daily_units
+        self.runs_per_day = runs_per_day
+        self.search_share = search_share
+
+    def to_dict(self):
+        return {
+            "daily_units": self.daily_units,
+            "runs_per_day": self.runs_per_day,
+            "search_share": self.search_share,
+        }
+
+    @staticmethod
+    def from_dict(props: dict):
+        return QuotaProps(
+            daily_units=props["daily_units"],
+            runs_per_day=props.get("runs_per_day", 1),
+            search_share=props.get("search_share", 0.5),
+        )
+
+
+class QuotaPlanner:
+    def __init__(self, props: QuotaProps):
+        self.props = props
+        self.logger = getLogger(__name__)
+        self.budget = props.daily_units // props.runs_per_day
+        self.__lock = threading.Lock()
+        self.__spent = 0
+
+    def spend(self, units: int):
+        with self.__lock:
+            self.__spent += units
+
+    def spent(self) -> int:
+        with self.__lock:
+            return self.__spent
+
+    def remaining(self) -> int:
+        return max(0, self.budget - self.spent())
+
+    def pages_per_query(self, queries: int, cost: int, max_pages: int) -> int:
+        if queries == 0:
+            return 0
+        share = int(self.budget * self.props.search_share)
+        return min(max_pages, share // (cost * queries))
+
+    def allocate(
+        self, expected: dict[str, int], page_size: int, cost: int, max_pages: int
+    ) -> dict[str, int]:
+        # Greedy by marginal value: page k of a key is worth the items it is
+        # expected to add, so the budget goes to the fullest pages first
+        pages = {key: 0 for key in expected}
+        candidates = [
+            (-min(page_size, count - page * page_size), key)
+            for key, count in expected.items()
+            for page in range(min(max_pages, math.ceil(count / page_size)))
+        ]
+        for _, key in heapq.nsmallest(self.remaining() // cost, candidates):
+            pages[key] += 1
+        self.logger.info(
+            "Allocated %d pages over %d keys (%d/%d units spent)",
+            sum(pages.values()),
+            len(pages),
+            self.spent(),
+            self.budget,
+        )
+        return pages
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+from logging import getLogger
+
+from util.metrics import get_metrics
+
+
+class RateLimiterProps:
+    def __init__(self, name: str, limit: int, period: float, burst: int = 1):
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self.burst = burst
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "limit": self.limit,
+            "period": self.period,
+            "burst": self.burst,
+        }
+
+    @staticmethod
+    def from_dict(props: dict):
+        return RateLimiterProps(
+            name=props["name"],
+            limit=props["limit"],
+            period=props["period"],
+            burst=props.get("burst", 1),
+        )
+
+
+class RateLimiter:
+    def __init__(self, props: RateLimiterProps):
+        self.props = props
+        self.logger = getLogger(__name__)
+        self.rate = props.limit / props.period
+        self.__lock = threading.Lock()
+        self.__tokens = float(props.burst)
+        self.__updated_at = time.monotonic()
+        self.__blocked_until = 0.0
+        self.waited = get_metrics().counter(
+            "rate_limit_wait_seconds_total",
+            "Time callers slept waiting for a token",
+            limiter=props.name,
+        )
+
+    def __reserve(self, tokens: int) -> float:
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(
+                float(self.props.burst),
+                self.__tokens + (now - self.__updated_at) * self.rate,
+            )
+            self.__updated_at = now
+            # Tokens may go negative; the deficit is the queue of waiting callers
+            self.__tokens -= tokens
+            return max(0.0, -self.__tokens / self.rate, self.__blocked_until - now)
+
+    def update(self, headers):
+        remaining = headers.get("x-rate-limit-remaining")
+        reset = headers.get("x-rate-limit-reset")
+        if remaining is None or reset is None:
+            return
+        try:
+            remaining = int(remaining)
+            reset = float(reset)
+        except ValueError:
+            return
+        if remaining > 0:
+            return
+        with self.__lock:
+            # The reset header is epoch seconds; the bucket runs on monotonic time
+            blocked_until = time.monotonic() + max(0.0, reset - time.time())
+            if blocked_until > self.__blocked_until:
+                self.__blocked_until = blocked_until
+                self.logger.info(
+                    "Rate limit exhausted %s: blocked %.0fs",
+                    self.props.name,
+                    blocked_until - time.monotonic(),
+                )
+
+    def acquire(self, tokens: int = 1):
+        wait = self.__reserve(tokens)
+        if wait > 0:
+            self.logger.debug("Rate limited %s: %.2fs", self.props.name, wait)
+            self.waited.inc(wait)
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 1):
+        wait = self.__reserve(tokens)
+        if wait > 0:
+            self.logger.debug("Rate limited %s: %.2fs", self.props.name, wait)
+            self.waited.inc(wait)
+            await asyncio.sleep(wait)
+
+
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(props: RateLimiterProps) -> RateLimiter:
+    with _limiters_lock:
+        if props.name not in _limiters:
+            _limiters[props.name] = RateLimiter(props)
+        return _limiters[props.name]
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import threading
+from datetime import date, datetime
+from glob import glob
+from logging import getLogger
+
+from util.serializer import dumps_canonical, loads
+from util.sink import JsonlSink, iter_lines
+
+logger = getLogger(__name__)
+
+OBJECTS_SUFFIX = "raw_objects"
+
+
+class RawStore:
+    def __init__(self, sink: JsonlSink):
+        self.sink = sink
+        self.__lock = threading.Lock()
+        self.__date: date | None = None
+        self.__hashes: set[str] = set()
+        self.__ref_suffixes: set[str] = set()
+
+    def put(self, data: dict, suffix: str, entity_lists=None) -> str:
+        # Entities are stored as separate objects and replaced by their hash
+        # in the response skeleton while it is encoded, then put back
+        lists = entity_lists(data) if entity_lists is not None else []
+        saved = [entities[:] for entities in lists]
+        try:
+            for entities in lists:
+                entities[:] = [{"$ref": self.__put_object(e)} for e in entities]
+            digest = self.__put_object(data)
+        finally:
+            for entities, original in zip(lists, saved):
+                entities[:] = original
+        with self.__lock:
+            if suffix not in self.__ref_suffixes:
+                self.__ref_suffixes.add(suffix)
+                self.sink.depend(f"{suffix}_refs", OBJECTS_SUFFIX)
+        self.sink.write(
+            {
+                "ref": digest,
+                "timestamp": datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
+            },
+            f"{suffix}_refs",
+        )
+        return digest
+
+    def __put_object(self, data) -> str:
+        payload = dumps_canonical(data)
+        digest = hashlib.blake2b(payload, digest_size=16).hexdigest()
+        with self.__lock:
+            # Objects are deduplicated per day so each day's archive is
+            # self-contained; overlapping fetch windows repeat within a day
+            if self.__date != date.today():
+                self.__date = date.today()
+                self.__hashes = set()
+            if digest in self.__hashes:
+                return digest
+            self.__hashes.add(digest)
+            # Written under the lock, so a ref to a hash another thread has
+            # claimed is never buffered ahead of the object itself
+            self.sink.write_line(
+                b'{"hash":"' + digest.encode() + b'","data":' + payload + b"}\n",
+                OBJECTS_SUFFIX,
+            )
+        return digest
+
+
+def resolve(data, objects: dict):
+    if isinstance(data, dict):
+        if len(data) == 1 and "$ref" in data:
+            return resolve(objects[data["$ref"]], objects)
+        return {key: resolve(value, objects) for key, value in data.items()}
+    if isinstance(data, list):
+        return [resolve(value, objects) for value in data]
+    return data
+
+
+def iter_raw_with_timestamp(output_dir: str, target_date: date | str, suffix: str):
+    objects = {}
+    for path in glob(
+        os.path.join(output_dir, f"{target_date}_{OBJECTS_SUFFIX}.jsonl*")
+    ):
+        for line in iter_lines(path):
+            obj = loads(line)
+            objects[obj["hash"]] = obj["data"]
+    for path in glob(os.path.join(output_dir, f"{target_date}_{suffix}_refs.jsonl*")):
+        for line in iter_lines(path):
+            ref = loads(line)
+            try:
+                yield ref["timestamp"], resolve(objects[ref["ref"]], objects)
+            except KeyError as ex:
+                logger.warning("Missing raw object: %s", ex)
+    # Archives written before the store hold full responses per line and no
+    # fetch time, so the start of the file's day stands in for it
+    for path in glob(os.path.join(output_dir, f"{target_date}_{suffix}.jsonl*")):
+        for line in iter_lines(path):
+            yield f"{target_date}T00:00:00Z", loads(line)
+
+
+def iter_raw(output_dir: str, target_date: date | str, suffix: str):
+    for _, data in iter_raw_with_timestamp(output_dir, target_date, suffix):
+        yield data
@@ -0,0 +1,22 @@
+import logging
+import re
+
+SECRET_PARAM_PATTERN = re.compile(
+    r"(?P<name>[?&](?:key|api_key|access_token|auth_token)=)[^&\s'\"]+"
+)
+
+
+def redact(text: str) -> str:
+    return SECRET_PARAM_PATTERN.sub(r"\g<name>REDACTED", text)
+
+
+class RedactFilter(logging.Filter):
+    # Installed on the output handlers so records from every logger are
+    # covered, including urllib3's DEBUG lines with full request paths
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        redacted = redact(message)
+        if redacted != message:
+            record.msg = redacted
+            record.args = None
+        return True
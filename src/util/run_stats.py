@@ -0,0 +1,15 @@
+import threading
+
+
+class RunStats:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__counts: dict[str, int] = {}
+
+    def add(self, name: str, value: int = 1):
+        with self.__lock:
+            self.__counts[name] = self.__counts.get(name, 0) + value
+
+    def to_dict(self) -> dict[str, int]:
+        with self.__lock:
+            return dict(self.__counts)
@@ -0,0 +1,91 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from logging import getLogger
+from pathlib import Path
+
+from util.metrics import get_metrics, summarize
+from util.serializer import dumps_line
+
+
+class SchedulerProps:
+    def __init__(self, max_workers: int = 4, history_path: str | None = None):
+        self.max_workers = max_workers
+        self.history_path = history_path
+
+    def to_dict(self):
+        return {
+            "max_workers": self.max_workers,
+            "history_path": self.history_path,
+        }
+
+    @staticmethod
+    def from_dict(props: dict):
+        return SchedulerProps(
+            max_workers=props.get("max_workers", 4),
+            history_path=props.get("history_path"),
+        )
+
+
+class Scheduler:
+    def __init__(self, props: SchedulerProps):
+        self.props = props
+        self.logger = getLogger(__name__)
+        self.executor = ThreadPoolExecutor(
+            max_workers=props.max_workers, thread_name_prefix="job"
+        )
+        self.__lock = threading.Lock()
+        self.__running: set[str] = set()
+
+    def submit(self, name: str, job) -> bool:
+        # A job that is running or still queued is not submitted again, so
+        # slow runs are skipped over instead of piling up behind each other
+        with self.__lock:
+            if name in self.__running:
+                self.logger.info("Skipped %s: previous run has not finished", name)
+                return False
+            self.__running.add(name)
+        self.executor.submit(self.__run, name, job)
+        return True
+
+    def __run(self, name: str, job):
+        started_at = datetime.now()
+        wall_started_at = time.perf_counter()
+        metrics_before = get_metrics().snapshot()
+        stats = None
+        error = None
+        try:
+            stats = job()
+        except Exception as ex:
+            self.logger.error(ex)
+            error = str(ex)
+        finally:
+            run = {
+                "job": name,
+                "started_at": started_at.strftime("%Y-%m-%dT%H:%M:%S"),
+                "finished_at": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+                "wall_time": round(time.perf_counter() - wall_started_at, 3),
+                "stats": stats if stats is not None else {},
+                # Metrics are process-wide, so a run that overlaps another job
+                # also sees that job's series; endpoint labels tell them apart
+                "metrics": summarize(metrics_before, get_metrics().snapshot()),
+                "error": error,
+            }
+            self.logger.info(
+                "Finished %s in %.1fs: %s", name, run["wall_time"], run["stats"]
+            )
+            self.__record(run)
+            with self.__lock:
+                self.__running.discard(name)
+
+    def __record(self, run: dict):
+        if self.props.history_path is None:
+            return
+        with self.__lock:
+            Path(self.props.history_path).parent.mkdir(parents=True, exist_ok=True)
+            with open(self.props.history_path, "ab") as f:
+                f.write(dumps_line(run))
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
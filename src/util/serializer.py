@@ -0,0 +1,100 @@
+import json
+import threading
+
+from util.metrics import get_metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonSerializer:
+    name = "json"
+
+    def loads(self, data: bytes | str):
+        return json.loads(data)
+
+    def dumps(self, data) -> bytes:
+        return json.dumps(data, ensure_ascii=False).encode()
+
+    def dumps_line(self, data) -> bytes:
+        return (json.dumps(data, ensure_ascii=False) + "\n").encode()
+
+    def dumps_canonical(self, data) -> bytes:
+        return json.dumps(
+            data, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        ).encode()
+
+
+class OrjsonSerializer(JsonSerializer):
+    name = "orjson"
+
+    # orjson rejects integers beyond 64 bits and non-str keys, which the
+    # stdlib encoder accepts; those rare payloads fall back to it
+    def loads(self, data: bytes | str):
+        return orjson.loads(data)
+
+    def dumps(self, data) -> bytes:
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            return super().dumps(data)
+
+    def dumps_line(self, data) -> bytes:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            return super().dumps_line(data)
+
+    def dumps_canonical(self, data) -> bytes:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            return super().dumps_canonical(data)
+
+
+SERIALIZERS = {
+    JsonSerializer.name: JsonSerializer,
+    OrjsonSerializer.name: OrjsonSerializer,
+}
+
+_serializer: JsonSerializer = OrjsonSerializer() if orjson else JsonSerializer()
+_serializer_lock = threading.Lock()
+_loads_seconds = get_metrics().histogram(
+    "json_loads_seconds",
+    "Time spent parsing JSON documents",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5),
+)
+
+
+def configure_serializer(name: str) -> JsonSerializer:
+    global _serializer
+    if name not in SERIALIZERS:
+        raise ValueError(f"Unknown serializer: {name}")
+    if name == OrjsonSerializer.name and orjson is None:
+        raise ValueError("orjson serializer requires the orjson package")
+    with _serializer_lock:
+        _serializer = SERIALIZERS[name]()
+        return _serializer
+
+
+def get_serializer() -> JsonSerializer:
+    return _serializer
+
+
+def loads(data: bytes | str):
+    with _loads_seconds.time():
+        return _serializer.loads(data)
+
+
+def dumps(data) -> bytes:
+    return _serializer.dumps(data)
+
+
+def dumps_line(data) -> bytes:
+    return _serializer.dumps_line(data)
+
+
+def dumps_canonical(data) -> bytes:
+    return _serializer.dumps_canonical(data)
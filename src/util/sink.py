@@ -0,0 +1,253 @@
+import atexit
+import gzip
+import io
+import os
+import threading
+import time
+from datetime import date
+from logging import getLogger
+
+from util.metrics import get_metrics
+from util.serializer import dumps_line
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTENSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+class JsonlSinkProps:
+    def __init__(
+        self,
+        flush_bytes: int = 1024 * 1024,
+        flush_interval: float = 5.0,
+        compression: str | None = None,
+        compress_suffixes: list[str] | None = None,
+    ):
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.compression = compression
+        self.compress_suffixes = compress_suffixes
+
+    def to_dict(self):
+        return {
+            "flush_bytes": self.flush_bytes,
+            "flush_interval": self.flush_interval,
+            "compression": self.compression,
+            "compress_suffixes": self.compress_suffixes,
+        }
+
+    @staticmethod
+    def from_dict(props: dict):
+        return JsonlSinkProps(
+            flush_bytes=props["flush_bytes"],
+            flush_interval=props["flush_interval"],
+            compression=props.get("compression"),
+            compress_suffixes=props.get("compress_suffixes"),
+        )
+
+
+class JsonlStream:
+    def __init__(
+        self,
+        path: str,
+        target_date: date,
+        compression: str | None,
+        sink: str,
+        suffix: str | None,
+    ):
+        self.path = path
+        self.date = target_date
+        self.compression = compression
+        metrics = get_metrics()
+        self.lines_written = metrics.counter(
+            "sink_lines_total", "Lines written", sink=sink, suffix=suffix or ""
+        )
+        self.bytes_written = metrics.counter(
+            "sink_bytes_total",
+            "Bytes written after compression",
+            sink=sink,
+            suffix=suffix or "",
+        )
+        self.buffer: list[bytes] = []
+        self.buffered_bytes = 0
+        self.on_flush: list = []
+        self.flushed_at = time.monotonic()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, "ab")
+        if compression == "zstd":
+            self.compressor = zstandard.ZstdCompressor()
+
+    def write(self, line: bytes, on_flush=None):
+        self.buffer.append(line)
+        self.buffered_bytes += len(line)
+        self.lines_written.inc()
+        if on_flush is not None:
+            self.on_flush.append(on_flush)
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            data = b"".join(self.buffer)
+            # Each flush is a self-contained frame, so a crash loses at most
+            # the unflushed buffer and the file stays readable
+            if self.compression == "gzip":
+                data = gzip.compress(data)
+            elif self.compression == "zstd":
+                data = self.compressor.compress(data)
+            self.file.write(data)
+            self.file.flush()
+            self.bytes_written.inc(len(data))
+            self.buffer = []
+            self.buffered_bytes = 0
+        self.flushed_at = time.monotonic()
+        # Callbacks wait for the lines they came with to reach the file
+        callbacks, self.on_flush = self.on_flush, []
+        for callback in callbacks:
+            callback()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class JsonlSink:
+    def __init__(self, output_dir: str, props: JsonlSinkProps):
+        if props.compression not in EXTENSIONS:
+            raise ValueError(f"Unknown compression: {props.compression}")
+        if props.compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        self.output_dir = output_dir
+        self.props = props
+        self.logger = getLogger(__name__)
+        self.__lock = threading.Lock()
+        self.__streams: dict[str | None, JsonlStream] = {}
+        self.__dependencies: dict[str | None, set[str | None]] = {}
+        self.__flusher: threading.Thread | None = None
+
+    def path(self, suffix: str | None = None, target_date: date | None = None):
+        target_date = target_date if target_date is not None else date.today()
+        return os.path.join(
+            self.output_dir,
+            f"{target_date}{'_' + suffix if suffix is not None else ''}.jsonl"
+            + EXTENSIONS[self.__compression(suffix)],
+        )
+
+    def depend(self, suffix: str | None, dependency: str | None):
+        # Lines in suffix refer to lines in dependency, so dependency is always
+        # flushed first and a crash never leaves a dangling reference
+        with self.__lock:
+            self.__dependencies.setdefault(suffix, set()).add(dependency)
+
+    def write(self, data: dict, suffix: str | None = None, on_flush=None):
+        self.write_line(dumps_line(data), suffix, on_flush)
+
+    def write_line(self, line: bytes, suffix: str | None = None, on_flush=None):
+        today = date.today()
+        with self.__lock:
+            stream = self.__streams.get(suffix)
+            if stream is not None and stream.date != today:
+                self.__flush_stream(suffix)
+                stream.close()
+                stream = None
+            if stream is None:
+                stream = JsonlStream(
+                    self.path(suffix, today),
+                    today,
+                    self.__compression(suffix),
+                    os.path.basename(self.output_dir),
+                    suffix,
+                )
+                self.__streams[suffix] = stream
+                self.__start_flusher()
+            stream.write(line, on_flush)
+            if (
+                stream.buffered_bytes >= self.props.flush_bytes
+                or time.monotonic() - stream.flushed_at >= self.props.flush_interval
+            ):
+                self.__flush_stream(suffix)
+
+    def flush(self):
+        with self.__lock:
+            for suffix in self.__streams:
+                self.__flush_stream(suffix)
+
+    def close(self):
+        with self.__lock:
+            for suffix in self.__streams:
+                self.__flush_stream(suffix)
+            for stream in self.__streams.values():
+                stream.close()
+            self.__streams = {}
+
+    def __flush_stream(self, suffix: str | None):
+        for dependency in self.__dependencies.get(suffix, ()):
+            if dependency in self.__streams:
+                self.__streams[dependency].flush()
+        self.__streams[suffix].flush()
+
+    def __start_flusher(self):
+        # Writes only check the interval of the stream they land on, so a
+        # stream that goes quiet is flushed from here instead
+        if self.__flusher is not None or self.props.flush_interval <= 0:
+            return
+        self.__flusher = threading.Thread(
+            target=self.__flush_periodically,
+            name=f"sink-{os.path.basename(self.output_dir)}",
+            daemon=True,
+        )
+        self.__flusher.start()
+
+    def __flush_periodically(self):
+        while True:
+            time.sleep(min(self.props.flush_interval, 1.0))
+            with self.__lock:
+                for suffix, stream in self.__streams.items():
+                    if time.monotonic() - stream.flushed_at < self.props.flush_interval:
+                        continue
+                    try:
+                        self.__flush_stream(suffix)
+                    except Exception as ex:
+                        self.logger.error(ex)
+
+    def __compression(self, suffix: str | None) -> str | None:
+        if self.props.compress_suffixes is None:
+            return self.props.compression
+        if suffix in self.props.compress_suffixes:
+            return self.props.compression
+        return None
+
+
+def iter_lines(path: str):
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            yield from f
+    elif path.endswith(".zst"):
+        with open(path, "rb") as f:
+            reader = zstandard.ZstdDecompressor().stream_reader(
+                f, read_across_frames=True
+            )
+            yield from io.BufferedReader(reader)
+    else:
+        with open(path, "rb") as f:
+            yield from f
+
+
+_sinks: dict[str, JsonlSink] = {}
+_sinks_lock = threading.Lock()
+
+
+def get_sink(output_dir: str, props: JsonlSinkProps) -> JsonlSink:
+    key = os.path.abspath(output_dir)
+    with _sinks_lock:
+        if key not in _sinks:
+            _sinks[key] = JsonlSink(key, props)
+        return _sinks[key]
+
+
+@atexit.register
+def close_sinks():
+    with _sinks_lock:
+        for sink in _sinks.values():
+            sink.close()